@@ -1,36 +1,46 @@
-from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe
+from recipes.models import Recipe, Tag
 
 
-class IngredientFilter(FilterSet):
-    name = filters.CharFilter(method='filter_name')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
-
-    def filter_name(self, queryset, name, value):
-        return queryset.filter(
-            Q(name__istartswith=value) | Q(name__icontains=value)
-        ).annotate(
-            startswith=ExpressionWrapper(
-                Q(name__istartswith=value),
-                output_field=BooleanField()
-            )
-        ).order_by('-startswith')
+def search_by_name(queryset, value):
+    queryset = queryset.filter(
+        Q(name__istartswith=value) | Q(name__icontains=value)
+    ).annotate(
+        startswith=ExpressionWrapper(
+            Q(name__istartswith=value),
+            output_field=BooleanField()
+        )
+    )
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.order_by('-startswith')
+    return queryset.annotate(
+        similarity=TrigramSimilarity('name', value)
+    ).order_by('-startswith', '-similarity')
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    name = filters.CharFilter(method='filter_name')
+    tags = filters.ModelMultipleChoiceFilter(
+        field_name='tags__slug', to_field_name='slug',
+        queryset=Tag.objects.all())
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'Популярные'), ('trending', 'Набирающие')),
+        method='filter_ordering')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('name', 'author', 'tags', 'is_favorited',
+                  'is_in_shopping_cart', 'ordering')
+
+    def filter_name(self, queryset, name, value):
+        return search_by_name(queryset, value)
 
     def filter_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
@@ -41,3 +51,9 @@ class RecipeFilter(FilterSet):
         if value and self.request.user.is_authenticated:
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(
+            F(f'ranking__{value}_score').desc(nulls_last=True),
+            '-pub_date', '-id'
+        )
@@ -0,0 +1,79 @@
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.db import connection
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += perf_counter() - started
+
+
+@contextmanager
+def serialization_timer(request):
+    # Время сериализации без запросов к БД внутри нее; вложенные вызовы
+    # (сериализатор рецепта внутри списка) учитываются один раз.
+    request = getattr(request, '_request', request)
+    counter = getattr(request, 'query_counter', None)
+    if counter is None or getattr(request, 'serializing', False):
+        yield
+        return
+    request.serializing = True
+    started, db_started = perf_counter(), counter.duration
+    try:
+        yield
+    finally:
+        request.serializing = False
+        request.serialize_time += (perf_counter() - started
+                                   - counter.duration + db_started)
+
+
+class TimedSerializerMixin:
+    def to_representation(self, instance):
+        with serialization_timer(self.context.get('request')):
+            return super().to_representation(instance)
+
+
+def get_view_action(resolver_match, method):
+    view = getattr(resolver_match, 'func', None)
+    cls = getattr(view, 'cls', None)
+    if cls is None:
+        return None, None
+    action = getattr(view, 'actions', {}).get(method.lower())
+    return cls, action
+
+
+def get_view_tag(resolver_match, method):
+    cls, action = get_view_action(resolver_match, method)
+    if cls is None:
+        return getattr(resolver_match, 'view_name', None)
+    basename = resolver_match.func.initkwargs.get('basename') or cls.__name__
+    return f'{basename}-{action}' if action else basename
+
+
+def get_query_budget(resolver_match, method):
+    cls, action = get_view_action(resolver_match, method)
+    return getattr(cls, 'query_budgets', {}).get(action)
+
+
+@contextmanager
+def query_budget(budget, using=connection):
+    counter = QueryCounter()
+    with using.execute_wrapper(counter):
+        yield counter
+    if counter.count > budget:
+        raise QueryBudgetExceeded(
+            f'Выполнено {counter.count} запросов к БД при лимите {budget}')
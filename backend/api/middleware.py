@@ -0,0 +1,59 @@
+import logging
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connection
+
+from api.instrumentation import QueryCounter, get_query_budget, get_view_tag
+
+logger = logging.getLogger('api.metrics')
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        request.query_counter = counter
+        request.render_time = 0.0
+        request.serialize_time = 0.0
+        started = perf_counter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        total = perf_counter() - started
+        app = (total - counter.duration - request.serialize_time
+               - request.render_time)
+
+        if settings.API_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join((
+                f'db;dur={counter.duration * 1000:.1f};'
+                f'desc="{counter.count} queries"',
+                f'serialize;dur={request.serialize_time * 1000:.1f}',
+                f'render;dur={request.render_time * 1000:.1f}',
+                f'app;dur={app * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ))
+        resolver_match = request.resolver_match
+        tag = get_view_tag(resolver_match, request.method)
+        logger.info(
+            '%s %s %s %s queries=%d db=%.1fms serialize=%.1fms '
+            'render=%.1fms total=%.1fms',
+            tag, request.method, request.path, response.status_code,
+            counter.count, counter.duration * 1000,
+            request.serialize_time * 1000, request.render_time * 1000,
+            total * 1000
+        )
+        budget = get_query_budget(resolver_match, request.method)
+        if budget is not None and counter.count > budget:
+            logger.warning(
+                '%s: выполнено %d запросов к БД при лимите %d',
+                tag, counter.count, budget
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        started = perf_counter()
+        response.render()
+        request.render_time += perf_counter() - started
+        return response
@@ -1,5 +1,49 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        # Django 2.2 считает COUNT(*) по подзапросу со всеми аннотациями,
+        # то есть вычисляет EXISTS для каждой строки ленты.
+        return self.object_list.values('pk').count()
+
+
+class LimitCursorPagination(CursorPagination):
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        # Курсор хранит только позицию в своей сортировке, поэтому
+        # сортировки фильтров (ordering, релевантность по name) он бы
+        # молча заменил.
+        if queryset.query.order_by:
+            raise ValidationError({
+                self.cursor_query_param:
+                    'Нельзя использовать вместе с сортировкой ordering '
+                    'или поиском по name'
+            })
+        return getattr(view, 'cursor_ordering', self.ordering)
 
 
 class LimitPagination(PageNumberPagination):
+    django_paginator_class = CountPaginator
     page_size_query_param = 'limit'
+    cursor_pagination_class = LimitCursorPagination
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        if cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
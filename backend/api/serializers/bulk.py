@@ -0,0 +1,14 @@
+from django.conf import settings
+from rest_framework import serializers
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_ACTION_MAX_ITEMS,
+        error_messages={
+            'max_length': 'Убедитесь, что в списке не больше '
+                          '{max_length} элементов.',
+        }
+    )
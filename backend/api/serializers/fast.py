@@ -0,0 +1,106 @@
+from collections import OrderedDict, defaultdict
+
+from api.instrumentation import serialization_timer
+from api.serializers.users import get_followed_author_ids
+from recipes.images import variant_urls
+from recipes.models import Recipe, RecipeIngredient
+
+USER_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+FOLLOW_FIELDS = USER_FIELDS + ('recipes_count',)
+TAG_FIELDS = ('id', 'name', 'color', 'slug')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit', 'amount')
+
+
+def image_url(image, request):
+    if not image:
+        return None
+    if request is not None:
+        return request.build_absolute_uri(image.url)
+    return image.url
+
+
+def is_subscribed(author_id, request):
+    if request.user.is_anonymous:
+        return False
+    return author_id in get_followed_author_ids(request)
+
+
+def user_data(row, request):
+    return OrderedDict((
+        *((field, row[field]) for field in USER_FIELDS),
+        ('is_subscribed', is_subscribed(row['id'], request)),
+    ))
+
+
+def build_user(row, request):
+    with serialization_timer(request):
+        return user_data(row, request)
+
+
+def build_users(rows, request):
+    with serialization_timer(request):
+        return [user_data(row, request) for row in rows]
+
+
+def build_follows(rows, latest_recipes, request):
+    with serialization_timer(request):
+        return [
+            OrderedDict((
+                *((field, row[field]) for field in USER_FIELDS),
+                ('is_subscribed', True),
+                ('recipes', build_recipe_infos(latest_recipes[row['id']],
+                                               request)),
+                ('recipes_count', row['recipes_count']),
+            ))
+            for row in rows
+        ]
+
+
+def build_recipe_infos(recipes, request):
+    return [
+        OrderedDict((
+            ('id', recipe.id),
+            ('name', recipe.name),
+            ('image', image_url(recipe.image, request)),
+            ('image_variants', variant_urls(recipe.image, request)),
+            ('cooking_time', recipe.cooking_time),
+        ))
+        for recipe in recipes
+    ]
+
+
+def build_recipe_contents(recipes, request):
+    ids = [recipe.pk for recipe in recipes]
+    tags = defaultdict(list)
+    for recipe_id, *tag in Recipe.tags.through.objects.filter(
+        recipe_id__in=ids
+    ).order_by('tag_id').values_list(
+        'recipe_id', 'tag__id', 'tag__name', 'tag__color', 'tag__slug'
+    ):
+        tags[recipe_id].append(OrderedDict(zip(TAG_FIELDS, tag)))
+    ingredients = defaultdict(list)
+    for recipe_id, *ingredient in RecipeIngredient.objects.filter(
+        recipe_id__in=ids
+    ).order_by('id').values_list(
+        'recipe_id', 'ingredient__id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount'
+    ):
+        ingredients[recipe_id].append(
+            OrderedDict(zip(INGREDIENT_FIELDS, ingredient)))
+    return {
+        recipe.pk: OrderedDict((
+            ('id', recipe.pk),
+            ('tags', tags[recipe.pk]),
+            ('author', OrderedDict(
+                (field, getattr(recipe.author, field))
+                for field in USER_FIELDS
+            )),
+            ('ingredients', ingredients[recipe.pk]),
+            ('name', recipe.name),
+            ('image', image_url(recipe.image, request)),
+            ('image_variants', variant_urls(recipe.image, request)),
+            ('text', recipe.text),
+            ('cooking_time', recipe.cooking_time),
+        ))
+        for recipe in recipes
+    }
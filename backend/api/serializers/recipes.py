@@ -1,32 +1,68 @@
-import base64
-
-from django.core.files.base import ContentFile
+import binascii
+from collections import OrderedDict
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import File
+from django.db.models import Manager, prefetch_related_objects
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+from api.instrumentation import TimedSerializerMixin, serialization_timer
+from api.serializers.fast import build_recipe_contents
 from api.serializers.users import UsersSerializer
+from recipes.cache import get_recipe_versions, get_version
+from recipes.images import decode_base64, decoded_size, variant_urls
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Tag)
 
+RECIPE_CONTENT_KEY = 'recipe_content:{}:{}'
+RECIPE_CONTENT_VERSIONS = ('catalog',)
+USER_FIELDS = ('is_favorited', 'is_in_shopping_cart')
+
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'max_size': 'Размер картинки не должен превышать {max_size} байт.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
+            # b64decode(validate=True) не пропускает переносы строк, которые
+            # добавляют многие кодировщики (по 76 символов в строке).
+            imgstr = ''.join(imgstr.split())
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='photo.' + ext)
+            max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+            if decoded_size(imgstr) > max_size:
+                self.fail('max_size', max_size=max_size)
+            try:
+                data = File(decode_base64(imgstr), name='photo.' + ext)
+            except binascii.Error:
+                self.fail('invalid_image')
 
         return super().to_internal_value(data)
 
 
-class TagSerializer(serializers.ModelSerializer):
+class ImageVariantsField(serializers.Field):
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'image'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return variant_urls(value, self.context.get('request'))
+
+
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = '__all__'
         read_only_fields = ('__all__',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
@@ -104,11 +140,24 @@ class RecipeSerializer(serializers.ModelSerializer):
         instance.tags.set(tags)
         self.get_ingredients(instance, ingredients)
 
-        return super().update(instance, validated_data)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=(*validated_data, 'pub_date'))
+        return instance
 
     def to_representation(self, instance):
-        context = {'request': self.context.get('request')}
-        return GetRecipeSerializer(instance, context=context).data
+        return GetRecipeSerializer(instance, context=self.context).data
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        with serialization_timer(self.context.get('request')):
+            contents = self.child.get_contents(recipes)
+            return [
+                self.child.merge_user_fields(recipe, contents[recipe.pk])
+                for recipe in recipes
+            ]
 
 
 class GetRecipeSerializer(serializers.ModelSerializer):
@@ -118,23 +167,95 @@ class GetRecipeSerializer(serializers.ModelSerializer):
                                              source='recipe_ingredient')
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_variants', 'text', 'cooking_time')
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        with serialization_timer(self.context.get('request')):
+            return self.merge_user_fields(
+                instance, self.get_contents([instance])[instance.pk])
+
+    def get_contents(self, recipes):
+        request = self.context.get('request')
+        versions = ':'.join(
+            get_version(name)[0] for name in RECIPE_CONTENT_VERSIONS)
+        recipe_versions = get_recipe_versions(
+            [recipe.pk for recipe in recipes])
+        keys = {
+            recipe.pk: RECIPE_CONTENT_KEY.format(recipe.pk, md5(
+                f'{recipe.pub_date.isoformat()}:'
+                f'{request.build_absolute_uri("/")}:{versions}:'
+                f'{recipe_versions[recipe.pk]}'.encode()
+            ).hexdigest())
+            for recipe in recipes
+        }
+        contents = cache.get_many(keys.values())
+        missing = [recipe for recipe in recipes
+                   if keys[recipe.pk] not in contents]
+        for pk, content in self.build_contents(missing).items():
+            contents[keys[pk]] = content
+        cache.set_many(
+            {keys[recipe.pk]: contents[keys[recipe.pk]]
+             for recipe in missing},
+            settings.RESPONSE_CACHE_TIMEOUT
+        )
+        return {recipe.pk: contents[keys[recipe.pk]] for recipe in recipes}
+
+    def build_contents(self, recipes):
+        if settings.FAST_READ_SERIALIZERS:
+            return build_recipe_contents(
+                recipes, self.context.get('request'))
+        prefetch_related_objects(
+            recipes, *self.context.get('prefetch_related_plan', ()))
+        contents = {}
+        for recipe in recipes:
+            content = super().to_representation(recipe)
+            for field in USER_FIELDS:
+                del content[field]
+            del content['author']['is_subscribed']
+            contents[recipe.pk] = content
+        return contents
+
+    def merge_user_fields(self, instance, content):
+        is_subscribed = getattr(instance, 'is_subscribed', None)
+        if is_subscribed is not None:
+            instance.author.is_subscribed = is_subscribed
+        author = content['author'].copy()
+        author['is_subscribed'] = self.fields['author'].get_is_subscribed(
+            instance.author)
+        representation = OrderedDict()
+        for field in self.Meta.fields:
+            if field == 'author':
+                representation[field] = author
+            elif field in USER_FIELDS:
+                representation[field] = getattr(self, f'get_{field}')(
+                    instance)
+            else:
+                representation[field] = content[field]
+        return representation
 
     def get_is_favorited(self, object):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        is_favorited = getattr(object, 'is_favorited', None)
+        if is_favorited is not None:
+            return is_favorited
         return object.favorite.filter(user=user).exists()
 
     def get_is_in_shopping_cart(self, object):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        is_in_shopping_cart = getattr(object, 'is_in_shopping_cart', None)
+        if is_in_shopping_cart is not None:
+            return is_in_shopping_cart
         return object.shopping_cart.filter(user=user).exists()
 
 
@@ -161,7 +282,9 @@ class ShoppingCartSerializer(FavoriteSerializer):
         model = ShoppingCart
 
 
-class RecipeInfoSerializer(serializers.ModelSerializer):
+class RecipeInfoSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
@@ -1,11 +1,26 @@
+from django.conf import settings
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework.exceptions import ValidationError
-from rest_framework.fields import SerializerMethodField
+from rest_framework.fields import IntegerField, SerializerMethodField
 
+from api.instrumentation import TimedSerializerMixin
 from users.models import Follow, User
 
 
-class UsersCreateSerializer(UserCreateSerializer):
+def get_followed_author_ids(request):
+    followed_author_ids = getattr(request, 'followed_author_ids', None)
+    if followed_author_ids is None:
+        followed_author_ids = set(Follow.objects.filter(
+            user=request.user).values_list('author_id', flat=True))
+        request.followed_author_ids = followed_author_ids
+    return followed_author_ids
+
+
+def reset_followed_author_ids(request):
+    request.followed_author_ids = None
+
+
+class UsersCreateSerializer(TimedSerializerMixin, UserCreateSerializer):
     class Meta:
         model = User
         fields = (
@@ -26,7 +41,7 @@ class UsersCreateSerializer(UserCreateSerializer):
         return value
 
 
-class UsersSerializer(UserSerializer):
+class UsersSerializer(TimedSerializerMixin, UserSerializer):
     is_subscribed = SerializerMethodField(read_only=True)
 
     class Meta:
@@ -41,15 +56,18 @@ class UsersSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, object):
-        user = self.context.get('request').user
-        if user.is_anonymous:
+        request = self.context.get('request')
+        if request.user.is_anonymous:
             return False
-        return Follow.objects.filter(user=user, author=object.id).exists()
+        is_subscribed = getattr(object, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
+        return object.id in get_followed_author_ids(request)
 
 
 class FollowSerializer(UsersSerializer):
     recipes = SerializerMethodField(read_only=True)
-    recipes_count = SerializerMethodField(read_only=True)
+    recipes_count = IntegerField(read_only=True)
 
     class Meta(UsersSerializer.Meta):
         fields = UsersSerializer.Meta.fields + ('recipes', 'recipes_count')
@@ -57,13 +75,9 @@ class FollowSerializer(UsersSerializer):
     def get_recipes(self, object):
         from api.serializers.recipes import RecipeInfoSerializer
 
-        request = self.context.get('request')
-        context = {'request': request}
-        recipe_limit = request.query_params.get('recipe_limit')
-        queryset = object.recipes.all()
-        if recipe_limit:
-            queryset = queryset[:int(recipe_limit)]
+        context = {'request': self.context.get('request')}
+        queryset = getattr(object, 'latest_recipes', None)
+        if queryset is None:
+            queryset = object.recipes.all()[:self.context.get(
+                'recipes_limit', settings.RECIPES_LIMIT_MAX)]
         return RecipeInfoSerializer(queryset, context=context, many=True).data
-
-    def get_recipes_count(self, object):
-        return object.recipes.count()
@@ -0,0 +1,63 @@
+import os
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.cache import cache
+from reportlab.pdfbase import pdfmetrics, ttfonts
+from reportlab.pdfgen import canvas
+
+from recipes.services import shopping_totals
+
+FONT_NAME = 'Arial'
+FONT_PATH = os.path.join(settings.BASE_DIR, 'data', 'arial.ttf')
+FONT_SIZE = 14
+TITLE = 'Список покупок'
+TITLE_HEIGHT = 750
+PAGE_TOP = 700
+PAGE_BOTTOM = 40
+LINE_HEIGHT = 25
+# Небольшие списки собираются в памяти, большие сбрасываются на диск.
+SPOOL_MAX_SIZE = 1024 * 1024
+SHOPPING_LIST_KEY = 'shopping_list:{}:{}'
+
+
+def register_fonts():
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(ttfonts.TTFont(FONT_NAME, FONT_PATH))
+
+
+def render_shopping_list(ingredients):
+    file = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    pdf = canvas.Canvas(file)
+    pdf.setFont(FONT_NAME, FONT_SIZE)
+    pdf.drawString(100, TITLE_HEIGHT, TITLE)
+    height = PAGE_TOP
+    for i, (name, amount, unit) in enumerate(ingredients, start=1):
+        if height <= PAGE_BOTTOM:
+            pdf.showPage()
+            pdf.setFont(FONT_NAME, FONT_SIZE)
+            height = TITLE_HEIGHT
+        pdf.drawString(80, height, f'{i}. {name} – {amount} {unit}')
+        height -= LINE_HEIGHT
+    pdf.showPage()
+    pdf.save()
+    file.seek(0)
+    return file
+
+
+def get_shopping_list(user, version):
+    key = SHOPPING_LIST_KEY.format(user.id, version)
+    content = cache.get(key)
+    if content is not None:
+        return BytesIO(content)
+
+    file = render_shopping_list(
+        shopping_totals(user).values_list(
+            'name', 'amount', 'measurement_unit').iterator())
+    size = file.seek(0, os.SEEK_END)
+    file.seek(0)
+    if size <= settings.SHOPPING_LIST_CACHE_MAX_SIZE:
+        cache.set(key, file.read(), settings.SHOPPING_LIST_CACHE_TIMEOUT)
+        file.seek(0)
+    return file
@@ -0,0 +1,912 @@
+import base64
+import json
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connections
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import resolve
+from django.utils import timezone
+from PIL import Image
+from reportlab.pdfgen import canvas
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api.instrumentation import get_query_budget, query_budget
+from api.renderers import FastJSONRenderer
+from api.serializers.fast import build_recipe_contents
+from api.serializers.recipes import Base64ImageField
+from api.shopping_list import PAGE_BOTTOM, render_shopping_list
+from recipes.cache import bump_version, get_recipe_versions
+from recipes.management.commands.benchmark import (anonymous_request,
+                                                   model_recipe_contents)
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.services import recount_counters, refresh_rankings
+from recipes.storage import recipe_image_storage
+from users.models import Follow, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+RECIPES = 110
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username,
+        email=f'{username}@example.org',
+        first_name='Имя',
+        last_name='Фамилия',
+        password='password-12345'
+    )
+
+
+def image_content(color=(226, 108, 45)):
+    content = BytesIO()
+    Image.new('RGB', (4, 4), color).save(content, 'PNG')
+    return content.getvalue()
+
+
+def image_data(color=(226, 108, 45)):
+    return ('data:image/png;base64,'
+            + base64.b64encode(image_content(color)).decode())
+
+
+def client_for(user=None):
+    client = APIClient()
+    if user is not None:
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+def run_parallel(requests):
+    barrier = threading.Barrier(len(requests))
+    responses = [None] * len(requests)
+
+    def send(number, request):
+        try:
+            barrier.wait()
+            responses[number] = request()
+        finally:
+            connections.close_all()
+
+    threads = [
+        threading.Thread(target=send, args=(number, request))
+        for number, request in enumerate(requests)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [response.status_code for response in responses]
+
+
+def create_recipes(authors, tags, ingredients, count):
+    recipes = []
+    image = recipe_image_storage.save(
+        'recipes/test.png', ContentFile(image_content()))
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            author=authors[number % len(authors)],
+            name=f'Рецепт {number}',
+            text='Описание',
+            cooking_time=number % 60 + 1,
+            image=image
+        )
+        for tag in (tags[(number + 1) % len(tags)], tags[number % len(tags)]):
+            recipe.tags.add(tag)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=ingredients[(number + shift) % len(ingredients)],
+                amount=number + shift + 1
+            ) for shift in range(2)
+        )
+        recipes.append(recipe)
+    return recipes
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANT_WORKERS=0)
+class ApiTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}')
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(10)
+        ]
+        cls.viewer = create_user('viewer')
+        cls.authors = [create_user(f'author{number}') for number in range(3)]
+        cls.recipes = create_recipes(
+            cls.authors, cls.tags, cls.ingredients, RECIPES)
+        for recipe in cls.recipes[::3]:
+            Favorite.objects.create(user=cls.viewer, recipe=recipe)
+        for recipe in cls.recipes[::5]:
+            ShoppingCart.objects.create(user=cls.viewer, recipe=recipe)
+        Follow.objects.create(user=cls.viewer, author=cls.authors[0])
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.guest = client_for()
+        self.client = client_for(self.viewer)
+
+    def assert_counters_consistent(self):
+        counters = {
+            'recipes': list(Recipe.objects.order_by('id').values_list(
+                'favorites_count', 'in_carts_count')),
+            'users': list(User.objects.order_by('id').values_list(
+                'recipes_count', 'followers_count')),
+        }
+        recount_counters()
+        self.assertEqual(counters, {
+            'recipes': list(Recipe.objects.order_by('id').values_list(
+                'favorites_count', 'in_carts_count')),
+            'users': list(User.objects.order_by('id').values_list(
+                'recipes_count', 'followers_count')),
+        })
+
+
+class RecipeQueriesTest(ApiTestCase):
+    def recipe_data(self, shift=0):
+        return {
+            'tags': [tag.id for tag in self.tags[:2]],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10 + shift}
+                for ingredient in self.ingredients[shift:shift + 3]
+            ],
+            'name': f'Новый рецепт {shift}',
+            'image': image_data(),
+            'text': 'Описание',
+            'cooking_time': 15,
+        }
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        for limit in (6, 20, 50, 100):
+            with self.subTest(limit=limit), self.assertNumQueries(5):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_retrieve_query_count(self):
+        for recipe in (self.recipes[0], self.recipes[-1]):
+            with self.subTest(recipe=recipe.id), self.assertNumQueries(4):
+                response = self.client.get(f'/api/recipes/{recipe.id}/')
+            self.assertEqual(len(response.data['ingredients']), 2)
+
+    def test_create_and_update_query_count(self):
+        client = client_for(self.authors[0])
+        with self.assertNumQueries(17):
+            response = client.post(
+                '/api/recipes/', self.recipe_data(), format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data['ingredients']), 3)
+        with self.assertNumQueries(20):
+            response = client.patch(
+                f'/api/recipes/{response.data["id"]}/',
+                self.recipe_data(shift=3), format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            [item['amount'] for item in response.data['ingredients']],
+            [13, 13, 13])
+
+
+class ShoppingListCacheTest(ApiTestCase):
+    url = '/api/recipes/download_shopping_cart/'
+
+    def get_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        b''.join(response.streaming_content)
+        return response['ETag']
+
+    def test_repeat_download_is_not_modified(self):
+        etag = self.get_etag()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_version_changes_on_data_changes(self):
+        recipe = self.recipes[0]
+        ingredient = Ingredient.objects.get(pk=self.ingredients[0].pk)
+        ingredient.measurement_unit = 'кг'
+        cart_url = f'/api/recipes/{self.recipes[2].id}/shopping_cart/'
+        bulk_url = '/api/recipes/shopping_cart/'
+        bulk_data = {'ids': [self.recipes[2].id, self.recipes[3].id]}
+        changes = (
+            ingredient.save,
+            lambda: bump_version('ingredient'),
+            lambda: RecipeIngredient.objects.filter(
+                recipe=recipe).first().delete(),
+            lambda: Recipe.objects.get(pk=recipe.pk).save(),
+            lambda: ShoppingCart.objects.filter(
+                user=self.viewer).first().delete(),
+            lambda: ShoppingCart.objects.create(
+                user=self.viewer, recipe=self.recipes[1]),
+            lambda: self.client.post(cart_url),
+            lambda: self.client.delete(cart_url),
+            lambda: self.client.post(bulk_url, bulk_data, format='json'),
+            lambda: self.client.delete(bulk_url, bulk_data, format='json'),
+        )
+        etag = self.get_etag()
+        for number, change in enumerate(changes):
+            with self.subTest(change=number):
+                change()
+                new_etag = self.get_etag()
+                self.assertNotEqual(new_etag, etag)
+                etag = new_etag
+
+
+class Base64ImageFieldTest(SimpleTestCase):
+    def test_wrapped_base64_is_decoded(self):
+        content = image_content()
+        encoded = base64.encodebytes(content).decode()
+        self.assertIn('\n', encoded.strip())
+        for data in (encoded, encoded.replace('\n', '\r\n '), '\n' + encoded):
+            with self.subTest(data=data[:20]):
+                file = Base64ImageField().to_internal_value(
+                    'data:image/png;base64,' + data)
+                self.assertEqual(file.read(), content)
+
+    def test_invalid_characters_are_rejected(self):
+        encoded = base64.b64encode(image_content()).decode()
+        with self.assertRaises(ValidationError):
+            Base64ImageField().to_internal_value(
+                'data:image/png;base64,' + encoded[:8] + '!' + encoded[8:])
+
+
+class ShoppingListRenderTest(SimpleTestCase):
+    def test_long_list_breaks_pages(self):
+        lines = [(f'Ингредиент {number}', number, 'г') for number in range(100)]
+        with mock.patch.object(canvas.Canvas, 'drawString',
+                               autospec=True) as draw_string:
+            render_shopping_list(iter(lines)).close()
+        heights = [call[0][2] for call in draw_string.call_args_list[1:]]
+        self.assertEqual(len(heights), len(lines))
+        self.assertGreaterEqual(min(heights), PAGE_BOTTOM)
+
+    def test_every_page_is_written(self):
+        lines = [(f'Ингредиент {number}', number, 'г') for number in range(100)]
+        with render_shopping_list(iter(lines)) as file:
+            content = file.read()
+        self.assertEqual(len(re.findall(rb'/Type /Page\b', content)), 4)
+
+
+class BenchmarkCommandTest(ApiTestCase):
+    def run_benchmark(self, *args):
+        stdout = StringIO()
+        call_command('benchmark', *args, '--repeat', '1', stdout=stdout)
+        return stdout.getvalue()
+
+    def test_shopping_list(self):
+        output = self.run_benchmark('shopping_list', '--cart-size', '20')
+        self.assertIn('строк в списке: 10', output)
+        self.assertIn('до: HttpResponse', output)
+        self.assertIn('после: суммы в БД', output)
+        self.assertFalse(User.objects.filter(username='benchmark').exists())
+
+    def test_autocomplete(self):
+        output = self.run_benchmark('autocomplete', '--queries', '10')
+        self.assertIn('Ингредиентов: 10, запросов за прогон: 10', output)
+        self.assertIn('после: индекс в памяти', output)
+
+    def test_query_plans(self):
+        output = self.run_benchmark(
+            'query_plans', '--recipes', '50', '--authors', '5', '--links', '2')
+        for index in ('recipe_pub_date_idx', 'recipe_author_pub_date_idx',
+                      'favorite_recipe_user_idx', 'cart_recipe_user_idx',
+                      'follow_user_author_idx'):
+            self.assertIn(index, output)
+        self.assertEqual(Recipe.objects.count(), RECIPES)
+
+    def test_pagination(self):
+        output = self.run_benchmark('pagination', '--sizes', '30')
+        self.assertEqual(output.count('курсор: '), 2)
+        self.assertEqual(Recipe.objects.count(), RECIPES)
+
+    def test_serializers(self):
+        output = self.run_benchmark('serializers')
+        self.assertIn(f'Рецептов: {RECIPES}, пользователей: 4', output)
+        for name in ('рецепты: ModelSerializer', 'рецепты: из строк values()',
+                     'пользователи: ModelSerializer',
+                     'пользователи: из строк values()'):
+            self.assertIn(name, output)
+
+    def test_renderer(self):
+        output = self.run_benchmark('renderer')
+        self.assertIn(f'Рецептов в ответе: {RECIPES}', output)
+        self.assertIn('байты совпадают: да', output)
+
+    def test_serializers_build_same_recipe_contents(self):
+        recipes = list(Recipe.objects.select_related('author'))
+        request = anonymous_request()
+        self.assertEqual(
+            json.dumps(build_recipe_contents(recipes, request)),
+            json.dumps(model_recipe_contents(recipes, request)))
+
+
+class IngredientSearchTest(ApiTestCase):
+    def test_prefix_matches_come_first(self):
+        Ingredient.objects.create(name='Сахар', measurement_unit='г')
+        Ingredient.objects.create(name='Ванильный сахар', measurement_unit='г')
+        response = self.guest.get('/api/ingredients/?name=сах')
+        self.assertEqual(
+            [item['name'] for item in response.json()],
+            ['Сахар', 'Ванильный сахар'])
+
+
+class BulkActionTest(ApiTestCase):
+    def bulk(self, method, url, ids):
+        response = getattr(self.client, method)(
+            url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return [
+            (result['id'], result['status'], result.get('error'))
+            for result in response.json()['results']
+        ]
+
+    def test_results_follow_request_order(self):
+        missing = Recipe.objects.order_by('-id').first().id + 1000
+        not_found = str(NotFound.default_detail)
+        new, other, favorited = (recipe.id for recipe in self.recipes[1:4])
+        self.assertEqual(
+            self.bulk('post', '/api/recipes/favorite/',
+                      [other, missing, favorited, new]),
+            [(other, 201, None), (missing, 404, not_found),
+             (favorited, 400, 'Этот рецепт уже добавлен'), (new, 201, None)])
+        self.assertEqual(
+            self.bulk('delete', '/api/recipes/favorite/',
+                      [new, self.recipes[4].id, missing, other]),
+            [(new, 204, None),
+             (self.recipes[4].id, 400, 'Этого рецепта нет в списке'),
+             (missing, 404, not_found), (other, 204, None)])
+
+    def test_duplicate_ids_are_applied_once(self):
+        first, second = self.recipes[1], self.recipes[2]
+        self.assertEqual(
+            self.bulk('post', '/api/recipes/shopping_cart/',
+                      [first.id, second.id, first.id, first.id]),
+            [(first.id, 201, None), (second.id, 201, None)])
+        first.refresh_from_db()
+        self.assertEqual(first.in_carts_count, 1)
+        self.assertEqual(ShoppingCart.objects.filter(
+            user=self.viewer, recipe=first).count(), 1)
+
+    def test_subscribe_reports_self_missing_and_existing_ids(self):
+        missing = User.objects.order_by('-id').first().id + 1000
+        not_found = str(NotFound.default_detail)
+        followed, author = self.authors[0].id, self.authors[1].id
+        viewer = self.viewer.id
+        self.assertEqual(
+            self.bulk('post', '/api/users/subscribe/',
+                      [author, viewer, missing, followed]),
+            [(author, 201, None),
+             (viewer, 400, 'Невозможно подписаться на себя'),
+             (missing, 404, not_found), (followed, 400, 'Вы уже подписаны')])
+        self.assertEqual(
+            self.bulk('delete', '/api/users/subscribe/',
+                      [followed, viewer, self.authors[2].id, author]),
+            [(followed, 204, None), (viewer, 404, not_found),
+             (self.authors[2].id, 404, not_found), (author, 204, None)])
+
+    def test_item_limit(self):
+        url = '/api/recipes/favorite/'
+        limit = settings.BULK_ACTION_MAX_ITEMS
+        ids = list(range(1, limit + 2))
+        response = self.client.post(url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ids', response.data)
+        self.assertEqual(len(self.bulk('post', url, ids[:limit])), limit)
+        for ids in ([], ['abc'], [0]):
+            with self.subTest(ids=ids):
+                response = self.client.post(url, {'ids': ids}, format='json')
+                self.assertEqual(response.status_code, 400)
+
+    def test_counters_after_bulk_link_and_unlink(self):
+        recipes = [recipe.id for recipe in self.recipes[:12]]
+        authors = [author.id for author in self.authors]
+        for url, ids in (
+            ('/api/recipes/favorite/', recipes),
+            ('/api/recipes/shopping_cart/', recipes),
+            ('/api/users/subscribe/', authors),
+        ):
+            with self.subTest(url=url):
+                self.bulk('post', url, ids)
+                self.assert_counters_consistent()
+                self.bulk('delete', url, ids[::2])
+                self.assert_counters_consistent()
+        counters = Recipe.objects.filter(pk__in=recipes).order_by('id')
+        self.assertEqual(
+            list(counters.values_list('favorites_count', 'in_carts_count')),
+            [(0, 0), (1, 1)] * 6)
+        self.assertEqual(
+            list(User.objects.filter(pk__in=authors).order_by(
+                'id').values_list('followers_count', flat=True)),
+            [0, 1, 0])
+
+
+class CountersTest(ApiTestCase):
+    def test_orm_changes_keep_counters(self):
+        self.assert_counters_consistent()
+        recipe = create_recipes(
+            self.authors[1:], self.tags, self.ingredients, 1)[0]
+        Favorite.objects.create(user=self.authors[0], recipe=recipe)
+        ShoppingCart.objects.create(user=self.authors[2], recipe=recipe)
+        Follow.objects.create(user=self.authors[2], author=self.authors[1])
+        self.assert_counters_consistent()
+        Follow.objects.filter(user=self.viewer).delete()
+        self.recipes[0].delete()
+        self.authors[2].delete()
+        self.assert_counters_consistent()
+
+    def test_api_changes_keep_counters(self):
+        author = client_for(self.authors[1])
+        recipe = self.recipes[1]
+        for client, method, url, code in (
+            (self.client, 'post', f'/api/recipes/{recipe.id}/favorite/', 201),
+            (self.client, 'post',
+             f'/api/recipes/{recipe.id}/shopping_cart/', 201),
+            (self.client, 'delete',
+             f'/api/recipes/{self.recipes[0].id}/favorite/', 204),
+            (self.client, 'post',
+             f'/api/users/{self.authors[1].id}/subscribe/', 201),
+            (self.client, 'delete',
+             f'/api/users/{self.authors[0].id}/subscribe/', 204),
+            (author, 'delete', f'/api/recipes/{recipe.id}/', 204),
+        ):
+            with self.subTest(method=method, url=url):
+                response = getattr(client, method)(url)
+                self.assertEqual(response.status_code, code, response.data)
+        self.assert_counters_consistent()
+
+    def test_decrement_never_goes_below_zero(self):
+        Recipe.objects.update(favorites_count=0, in_carts_count=0)
+        User.objects.update(recipes_count=0, followers_count=0)
+        recipe = self.recipes[0]
+        for method, url in (
+            ('delete', f'/api/recipes/{recipe.id}/favorite/'),
+            ('delete', f'/api/recipes/{recipe.id}/shopping_cart/'),
+            ('delete', f'/api/users/{self.authors[0].id}/subscribe/'),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(
+                    getattr(self.client, method)(url).status_code, 204)
+        response = client_for(recipe.author).delete(
+            f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            Recipe.objects.filter(favorites_count__gt=0).count(), 0)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANT_WORKERS=0)
+class ConcurrentCountersTest(TransactionTestCase):
+    clients = 8
+
+    def setUp(self):
+        cache.clear()
+        self.author = create_user('author')
+        self.recipe = create_recipes(
+            [self.author],
+            [Tag.objects.create(name='Тег', color='#000000', slug='tag')],
+            [Ingredient.objects.create(name=name, measurement_unit='г')
+             for name in ('Соль', 'Сахар')],
+            1
+        )[0]
+        self.clients = [
+            client_for(create_user(f'user{number}'))
+            for number in range(self.clients)
+        ]
+
+    def test_parallel_requests_keep_counters(self):
+        for method, code in (('post', 201), ('delete', 204)):
+            for action in ('favorite', 'shopping_cart'):
+                url = f'/api/recipes/{self.recipe.id}/{action}/'
+                with self.subTest(method=method, url=url):
+                    self.assertEqual(run_parallel([
+                        lambda client=client: getattr(client, method)(url)
+                        for client in self.clients
+                    ]), [code] * len(self.clients))
+            url = f'/api/users/{self.author.id}/subscribe/'
+            with self.subTest(method=method, url=url):
+                self.assertEqual(run_parallel([
+                    lambda client=client: getattr(client, method)(url)
+                    for client in self.clients
+                ]), [code] * len(self.clients))
+            self.assert_counters_match()
+
+    def test_parallel_identical_requests_apply_once(self):
+        user = create_user('twin')
+        clients = [client_for(user) for _ in self.clients]
+        urls = (
+            (f'/api/recipes/{self.recipe.id}/favorite/', 400),
+            (f'/api/recipes/{self.recipe.id}/shopping_cart/', 400),
+            (f'/api/users/{self.author.id}/subscribe/', 404),
+        )
+        for method, code in (('post', 201), ('delete', 204)):
+            for url, missing in urls:
+                conflict = 400 if method == 'post' else missing
+                with self.subTest(method=method, url=url):
+                    codes = run_parallel([
+                        lambda client=client: getattr(client, method)(url)
+                        for client in clients
+                    ])
+                    self.assertEqual(
+                        sorted(codes),
+                        sorted([code] + [conflict] * (len(clients) - 1)))
+            self.assert_counters_match()
+
+    def assert_counters_match(self):
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(
+            (self.recipe.favorites_count, self.recipe.in_carts_count,
+             self.author.followers_count),
+            (Favorite.objects.count(), ShoppingCart.objects.count(),
+             Follow.objects.count())
+        )
+
+
+class CursorPaginationTest(ApiTestCase):
+    def walk(self, client, url):
+        ids, pages = [], 0
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertNotIn('count', data)
+            ids += [item['id'] for item in data['results']]
+            url = data['next']
+            pages += 1
+        return ids, pages
+
+    def expected_ids(self, **filters):
+        return list(Recipe.objects.filter(**filters).distinct().order_by(
+            '-pub_date', '-id').values_list('id', flat=True))
+
+    def test_first_page(self):
+        data = self.guest.get('/api/recipes/?cursor=&limit=10').json()
+        self.assertEqual(set(data), {'next', 'previous', 'results'})
+        self.assertIsNone(data['previous'])
+        self.assertEqual([item['id'] for item in data['results']],
+                         self.expected_ids()[:10])
+
+    def test_next_links_walk_the_whole_feed(self):
+        ids, pages = self.walk(self.guest, '/api/recipes/?cursor=&limit=25')
+        self.assertEqual(ids, self.expected_ids())
+        self.assertEqual(pages, 5)
+
+    def test_previous_link_returns_to_the_first_page(self):
+        first = self.guest.get('/api/recipes/?cursor=&limit=10').json()
+        second = self.guest.get(first['next']).json()
+        self.assertEqual(self.guest.get(second['previous']).json(), first)
+
+    def test_filters_are_kept_with_cursor(self):
+        author, tag = self.authors[1], self.tags[2]
+        cases = (
+            (self.guest, f'author={author.id}', {'author': author}),
+            (self.guest, f'tags={tag.slug}', {'tags': tag}),
+            (self.client, 'is_favorited=1', {'favorite__user': self.viewer}),
+            (self.client, f'is_in_shopping_cart=1&author={author.id}',
+             {'shopping_cart__user': self.viewer, 'author': author}),
+        )
+        for client, query, filters in cases:
+            with self.subTest(query=query):
+                ids, _ = self.walk(
+                    client, f'/api/recipes/?cursor=&limit=4&{query}')
+                self.assertEqual(ids, self.expected_ids(**filters))
+
+    def test_subscriptions_cursor(self):
+        for author in self.authors[1:]:
+            Follow.objects.create(user=self.viewer, author=author)
+        ids, _ = self.walk(
+            self.client, '/api/users/subscriptions/?cursor=&limit=2')
+        self.assertEqual(ids, [author.id for author in self.authors])
+
+    def test_page_numbers_count_filtered_recipes(self):
+        data = self.client.get(
+            '/api/recipes/?limit=5&tags=tag0&tags=tag1&is_favorited=1').json()
+        self.assertEqual(data['count'], len(self.expected_ids(
+            tags__slug__in=('tag0', 'tag1'), favorite__user=self.viewer)))
+
+    def test_cursor_rejects_filter_orderings(self):
+        for query in ('ordering=popular', 'ordering=trending', 'name=Рецепт'):
+            with self.subTest(query=query):
+                self.assertEqual(self.guest.get(
+                    f'/api/recipes/?cursor=&limit=5&{query}').status_code, 400)
+                self.assertEqual(self.guest.get(
+                    f'/api/recipes/?limit=5&{query}').status_code, 200)
+
+    def test_invalid_cursor_is_not_found(self):
+        for url in ('/api/recipes/?cursor=invalid',
+                    '/api/users/subscriptions/?cursor=invalid'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class RecipeContentCacheTest(ApiTestCase):
+    def changed_recipes(self, change):
+        ids = [recipe.id for recipe in self.recipes]
+        before = get_recipe_versions(ids)
+        change()
+        after = get_recipe_versions(ids)
+        return {pk for pk in ids if before[pk] != after[pk]}
+
+    def recipe_ids(self, **filters):
+        return set(Recipe.objects.filter(**filters).values_list(
+            'id', flat=True))
+
+    def test_edits_invalidate_only_affected_recipes(self):
+        author = User.objects.get(pk=self.authors[0].pk)
+        ingredient = Ingredient.objects.get(pk=self.ingredients[0].pk)
+        tag = Tag.objects.get(pk=self.tags[0].pk)
+        recipe = self.recipes[0]
+        cases = (
+            ('signup', lambda: create_user('newcomer'), set()),
+            ('last login', lambda: self.viewer.save(
+                update_fields=('last_login',)), set()),
+            ('viewer profile', self.viewer.save, set()),
+            ('author profile', author.save,
+             self.recipe_ids(author=author)),
+            ('ingredient', ingredient.save,
+             self.recipe_ids(ingredients=ingredient)),
+            ('tag', tag.save, self.recipe_ids(tags=tag)),
+            ('recipe tags', lambda: recipe.tags.remove(tag), {recipe.id}),
+            ('recipe ingredients', lambda: RecipeIngredient.objects.filter(
+                recipe=recipe).first().delete(), {recipe.id}),
+            ('tag delete', tag.delete,
+             self.recipe_ids(tags=tag) - {recipe.id}),
+        )
+        for name, change, expected in cases:
+            with self.subTest(change=name):
+                self.assertEqual(self.changed_recipes(change), expected)
+
+    def test_signup_keeps_cached_pages(self):
+        url = '/api/recipes/?limit=6'
+        self.guest.get(url)
+        response = self.guest.post('/api/users/', {
+            'email': 'newcomer@example.org', 'username': 'newcomer',
+            'first_name': 'Имя', 'last_name': 'Фамилия',
+            'password': 'password-12345',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.guest.get(url).status_code, 200)
+
+    def test_edits_are_visible_in_cached_fragments(self):
+        url = f'/api/recipes/?limit={RECIPES}'
+        self.client.get(url)
+        author = User.objects.get(pk=self.authors[0].pk)
+        author.first_name = 'Новое имя'
+        author.save()
+        ingredient = Ingredient.objects.get(pk=self.ingredients[0].pk)
+        ingredient.name = 'Новый ингредиент'
+        ingredient.save()
+        for recipe in self.client.get(url).json()['results']:
+            with self.subTest(recipe=recipe['id']):
+                self.assertEqual(
+                    recipe['author']['first_name'] == 'Новое имя',
+                    recipe['author']['id'] == author.id)
+                self.assertEqual(
+                    'Новый ингредиент' in [
+                        item['name'] for item in recipe['ingredients']],
+                    ingredient.id in [
+                        item['id'] for item in recipe['ingredients']])
+
+
+class ResponseCacheTest(ApiTestCase):
+    def get_ids(self, url):
+        return [item['id'] for item in self.guest.get(url).json()['results']]
+
+    def test_rankings_refresh_invalidates_cached_lists(self):
+        url = '/api/recipes/?ordering=popular&limit=3'
+        refresh_rankings(timedelta(days=7))
+        self.assertEqual(self.get_ids(url), self.get_ids(url))
+        recipe = self.recipes[1]
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=100)
+        refresh_rankings(timedelta(days=7))
+        self.assertEqual(self.get_ids(url)[0], recipe.id)
+
+    def test_cached_responses_are_per_host(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        for host in ('a.example.org', 'b.example.org', 'a.example.org'):
+            with self.subTest(host=host):
+                response = self.guest.get(url, HTTP_HOST=host)
+                self.assertTrue(response.json()['image'].startswith(
+                    f'http://{host}/'))
+
+
+class FastSerializersContractTest(ApiTestCase):
+    def render(self, client, url, fast):
+        cache.clear()
+        with self.settings(FAST_READ_SERIALIZERS=fast):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.content
+
+    def test_fast_and_model_serializers_render_same_bytes(self):
+        recipe = self.recipes[2]
+        for client, url in (
+            (self.guest, '/api/recipes/?limit=50'),
+            (self.client, '/api/recipes/?limit=50'),
+            (self.client, '/api/recipes/?limit=6&page=3'),
+            (self.guest, f'/api/recipes/{recipe.id}/'),
+            (self.client, f'/api/recipes/{recipe.id}/'),
+            (self.client, '/api/users/'),
+            (self.client, '/api/users/?limit=2'),
+            (self.guest, f'/api/users/{self.authors[0].id}/'),
+            (self.client, f'/api/users/{self.authors[0].id}/'),
+            (self.client, f'/api/users/{self.authors[1].id}/'),
+            (self.client, '/api/users/me/'),
+            (self.client, '/api/users/subscriptions/'),
+            (self.client, '/api/users/subscriptions/?recipes_limit=2'),
+        ):
+            with self.subTest(url=url, authenticated=client is self.client):
+                self.assertEqual(
+                    self.render(client, url, fast=True),
+                    self.render(client, url, fast=False)
+                )
+
+    def test_tags_are_ordered_by_id(self):
+        for fast in (True, False):
+            with self.subTest(fast=fast):
+                content = json.loads(self.render(
+                    self.client, '/api/recipes/?limit=50', fast=fast))
+                for recipe in content['results']:
+                    ids = [tag['id'] for tag in recipe['tags']]
+                    self.assertEqual(ids, sorted(ids))
+
+
+class FastJSONRendererTest(ApiTestCase):
+    def assert_same_bytes(self, data):
+        self.assertEqual(FastJSONRenderer().render(data),
+                         JSONRenderer().render(data))
+
+    def test_renders_same_bytes_as_json_renderer(self):
+        for data in (
+            {'text': 'Борщ 🍲 "по-домашнему" \\ \n\t\x00\x1f\x7f'},
+            {'text': 'строка\u2028абзац\u2029', '\u2028': ['\u2029']},
+            OrderedDict((('b', 1), ('a', OrderedDict((
+                ('nested', [OrderedDict((('z', None), ('y', True)))]),
+                ('empty', OrderedDict()),
+            ))))),
+            {1: 'int', 2.5: 'float', False: 'bool', None: 'null'},
+            {'id': 2 ** 70, 'tuple': (1, 'два'), 'list': [[[]]]},
+            {'date': timezone.now(), 'uuid': uuid.UUID(int=1),
+             'decimal': Decimal('1.10'), 'delta': timedelta(minutes=5)},
+            [], 'строка', 0,
+        ):
+            with self.subTest(data=data):
+                self.assert_same_bytes(data)
+
+    def test_renders_api_responses_as_json_renderer(self):
+        recipe = self.recipes[0]
+        for client, url in (
+            (self.guest, '/api/recipes/?limit=50'),
+            (self.client, '/api/recipes/?limit=50'),
+            (self.client, f'/api/recipes/{recipe.id}/'),
+            (self.client, '/api/users/subscriptions/'),
+            (self.client, '/api/ingredients/'),
+            (self.client, '/api/tags/'),
+        ):
+            with self.subTest(url=url):
+                content = client.get(url).content
+                data = json.loads(content, object_pairs_hook=OrderedDict)
+                self.assertEqual(content, JSONRenderer().render(data))
+                self.assert_same_bytes(data)
+
+    def test_floats_differ_only_in_notation(self):
+        data = {'floats': [0.1, 3.0, 1e16, 5e-05, 123456789.125]}
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)),
+                         json.loads(JSONRenderer().render(data)))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_VARIANT_WORKERS=0)
+class QueryBudgetTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}')
+            for number in range(3)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(5)
+        ]
+        self.viewer = create_user('viewer')
+        self.authors = [create_user(f'author{number}') for number in range(3)]
+        self.recipes = create_recipes(
+            self.authors, self.tags, self.ingredients, 30)
+        for recipe in self.recipes[::2]:
+            Favorite.objects.create(user=self.viewer, recipe=recipe)
+            ShoppingCart.objects.create(user=self.viewer, recipe=recipe)
+        Follow.objects.create(user=self.viewer, author=self.authors[0])
+        self.client = client_for(self.viewer)
+
+    def request(self, method, url, data=None):
+        budget = get_query_budget(resolve(url.split('?')[0]), method)
+        self.assertIsNotNone(budget, f'Нет лимита запросов для {url}')
+        with query_budget(budget):
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 400)
+        return response
+
+    def test_read_actions_stay_within_budget(self):
+        recipe = self.recipes[0]
+        for url in (
+            '/api/recipes/?limit=30',
+            '/api/recipes/?is_favorited=1&tags=tag0&tags=tag1',
+            f'/api/recipes/{recipe.id}/',
+            '/api/recipes/download_shopping_cart/',
+            '/api/tags/',
+            f'/api/tags/{self.tags[0].id}/',
+            '/api/ingredients/?name=инг',
+            f'/api/ingredients/{self.ingredients[0].id}/',
+            '/api/users/',
+            f'/api/users/{self.authors[0].id}/',
+            '/api/users/me/',
+            '/api/users/subscriptions/?recipes_limit=3',
+        ):
+            with self.subTest(url=url):
+                self.request('get', url)
+
+    def test_metrics_include_serialization_time(self):
+        with self.assertLogs('api.metrics', 'INFO') as logs:
+            response = self.client.get('/api/recipes/?limit=30')
+        timings = dict(
+            re.match(r'(\w+);dur=([\d.]+)', metric).groups()
+            for metric in response['Server-Timing'].split(', ')
+        )
+        self.assertEqual(
+            list(timings), ['db', 'serialize', 'render', 'app', 'total'])
+        self.assertGreater(float(timings['serialize']), 0)
+        self.assertRegex(
+            logs.output[0],
+            r'recipe-list GET /api/recipes/ 200 queries=\d+ db=[\d.]+ms '
+            r'serialize=[\d.]+ms render=[\d.]+ms total=[\d.]+ms')
+
+    def test_write_actions_stay_within_budget(self):
+        recipe = self.recipes[1]
+        ids = [recipe.id for recipe in self.recipes[1:10]]
+        author = self.authors[1].id
+        for method, url, data in (
+            ('post', f'/api/recipes/{recipe.id}/favorite/', None),
+            ('delete', f'/api/recipes/{recipe.id}/favorite/', None),
+            ('post', f'/api/recipes/{recipe.id}/shopping_cart/', None),
+            ('delete', f'/api/recipes/{recipe.id}/shopping_cart/', None),
+            ('post', '/api/recipes/favorite/', {'ids': ids}),
+            ('delete', '/api/recipes/favorite/', {'ids': ids}),
+            ('post', '/api/recipes/shopping_cart/', {'ids': ids}),
+            ('delete', '/api/recipes/shopping_cart/', {'ids': ids}),
+            ('post', f'/api/users/{author}/subscribe/', None),
+            ('delete', f'/api/users/{author}/subscribe/', None),
+            ('post', '/api/users/subscribe/', {'ids': [author]}),
+            ('delete', '/api/users/subscribe/', {'ids': [author]}),
+        ):
+            with self.subTest(method=method, url=url):
+                self.request(method, url, data)
@@ -0,0 +1,101 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from api.serializers.bulk import BulkIdsSerializer
+from recipes.cache import get_version
+
+RESPONSE_KEY = 'response:{}:{}:{}'
+
+
+class CachedResponseMixin:
+    cache_versions = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def should_cache(self, request):
+        return request.accepted_renderer.format == 'json'
+
+    def get_cache_key(self, request, etag):
+        query = '&'.join(
+            f'{key}={value}'
+            for key, values in sorted(request.query_params.lists())
+            for value in sorted(values)
+        )
+        url = request.build_absolute_uri(request.path)
+        return RESPONSE_KEY.format(
+            self.basename, etag, md5(f'{url}?{query}'.encode()).hexdigest())
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if not self.should_cache(request):
+            return handler(request, *args, **kwargs)
+
+        versions = [get_version(name) for name in self.cache_versions]
+        etag = '"{}"'.format('-'.join(version for version, _ in versions))
+        last_modified = int(max(
+            modified for _, modified in versions).timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            key = self.get_cache_key(request, etag)
+            content = cache.get(key)
+            if content is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                content = request.accepted_renderer.render(
+                    response.data,
+                    request.accepted_media_type,
+                    self.get_renderer_context()
+                )
+                cache.set(key, content, settings.RESPONSE_CACHE_TIMEOUT)
+            response = HttpResponse(
+                content, content_type=request.accepted_renderer.media_type)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(
+            response, public=True, max_age=settings.RESPONSE_CACHE_MAX_AGE)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+class BulkActionMixin:
+    def get_bulk_ids(self):
+        serializer = BulkIdsSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data['ids']))
+
+    def get_bulk_response(self, ids, states, link, conflict, errors=None):
+        not_found = (status.HTTP_404_NOT_FOUND, str(NotFound.default_detail))
+        done = (status.HTTP_201_CREATED if link
+                else status.HTTP_204_NO_CONTENT, None)
+        results = []
+        for pk in ids:
+            if errors and pk in errors:
+                code, error = errors[pk]
+            elif pk not in states:
+                code, error = not_found
+            elif states[pk] == link:
+                code, error = conflict
+            else:
+                code, error = done
+            result = {'id': pk, 'status': code}
+            if error:
+                result['error'] = error
+            results.append(result)
+        return Response({'results': results})
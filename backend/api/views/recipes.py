@@ -1,68 +1,179 @@
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch
+from django.http import FileResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django_filters.rest_framework import DjangoFilterBackend
-from reportlab.pdfbase import pdfmetrics, ttfonts
-from reportlab.pdfgen import canvas
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny
+from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework.response import Response
 
-from api.filters import IngredientFilter, RecipeFilter
+from api.filters import RecipeFilter
 from api.paginations import LimitPagination
 from api.permissions import IsAuthorOrReadOnly
-from api.serializers.recipes import (FavoriteSerializer, IngredientSerializer,
-                                     RecipeSerializer, ShoppingCartSerializer,
-                                     TagSerializer)
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
-
-
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+from api.serializers.recipes import (FavoriteSerializer, GetRecipeSerializer,
+                                     IngredientSerializer, RecipeSerializer,
+                                     ShoppingCartSerializer, TagSerializer)
+from api.shopping_list import get_shopping_list
+from api.views.mixins import BulkActionMixin, CachedResponseMixin
+from recipes.cache import bump_version, get_cart_version
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.search import ingredient_index
+from recipes.services import add_link, bulk_link, bulk_unlink, remove_link
+from users.models import Follow
+
+
+class IngredientViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
     permission_classes = (AllowAny,)
     pagination_class = None
+    cache_versions = ('ingredient',)
+    query_budgets = {'list': 2, 'retrieve': 2}
 
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            self.search, request, *args, **kwargs)
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    def search(self, request, *args, **kwargs):
+        serializer = self.get_serializer(
+            ingredient_index.search(request.query_params.get('name', '')),
+            many=True
+        )
+        return Response(serializer.data)
+
+
+class TagViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    cache_versions = ('tag',)
+    query_budgets = {'list': 2, 'retrieve': 2}
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(BulkActionMixin, CachedResponseMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (IsAuthorOrReadOnly,)
     pagination_class = LimitPagination
+    cache_versions = ('recipe', 'tag', 'ingredient', 'ranking')
+    query_budgets = {
+        'list': 8,
+        'retrieve': 6,
+        'favorite': 5,
+        'favorite_delete': 4,
+        'shopping_cart': 5,
+        'shopping_cart_delete': 4,
+        'favorite_bulk': 6,
+        'favorite_bulk_delete': 6,
+        'shopping_cart_bulk': 6,
+        'shopping_cart_bulk_delete': 6,
+        'download_shopping_cart': 3,
+    }
+
+    prefetch_actions = ('list', 'retrieve')
+    select_related_plan = ('author',)
+    prefetch_related_plan = (
+        Prefetch('tags', queryset=Tag.objects.order_by('id')),
+        Prefetch('recipe_ingredient',
+                 queryset=RecipeIngredient.objects.select_related(
+                     'ingredient').order_by('id')),
+    )
+
+    def apply_prefetch_plan(self, queryset):
+        user = self.request.user
+        queryset = queryset.select_related(*self.select_related_plan)
+        if user.is_anonymous:
+            return queryset
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author'))),
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['prefetch_related_plan'] = self.prefetch_related_plan
+        return context
+
+    def get_serializer_class(self):
+        if self.action in self.prefetch_actions:
+            return GetRecipeSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.prefetch_actions:
+            return self.apply_prefetch_plan(queryset)
+        return queryset
+
+    def should_cache(self, request):
+        return request.user.is_anonymous and super().should_cache(request)
+
+    def refresh_instance(self, serializer):
+        serializer.instance = self.apply_prefetch_plan(
+            Recipe.objects.all()).get(pk=serializer.instance.pk)
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+        bump_version('recipe')
+        self.refresh_instance(serializer)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        bump_version('recipe')
+        self.refresh_instance(serializer)
+
+    def perform_destroy(self, instance):
+        instance.delete()
 
     def _action_post(self, pk, serializer_class):
         user = self.request.user
+        try:
+            recipe = PrimaryKeyRelatedField(queryset=Recipe.objects.only(
+                'id', 'name', 'image', 'cooking_time')).to_internal_value(pk)
+        except ValidationError as error:
+            raise ValidationError({'recipe': error.detail})
+        instance = serializer_class.Meta.model(user=user, recipe=recipe)
+        if not add_link(instance):
+            return Response({'error': 'Этот рецепт уже добавлен'},
+                            status=status.HTTP_400_BAD_REQUEST)
         serializer = serializer_class(
-            data={'user': user.id, 'recipe': pk},
-            context={'request': self.request}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+            instance, context={'request': self.request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def _action_delete(self, pk, serializer_class):
-        user = self.request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
-        object = serializer_class.Meta.model.objects.filter(
-            user=user, recipe=recipe
-        )
-        if object.exists():
-            object.delete()
+        if remove_link(serializer_class.Meta.model, self.request.user, pk):
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, pk=pk)
         return Response({'error': 'Этого рецепта нет в списке'},
                         status=status.HTTP_400_BAD_REQUEST)
 
+    def _bulk_action(self, serializer_class, link):
+        user = self.request.user
+        ids = self.get_bulk_ids()
+        model = serializer_class.Meta.model
+        if link:
+            states = bulk_link(model, user, ids)
+            conflict = 'Этот рецепт уже добавлен'
+        else:
+            states = bulk_unlink(model, user, ids)
+            conflict = 'Этого рецепта нет в списке'
+        return self.get_bulk_response(
+            ids, states, link, (status.HTTP_400_BAD_REQUEST, conflict))
+
     @action(methods=['POST'], detail=True)
     def favorite(self, request, pk):
         return self._action_post(pk, FavoriteSerializer)
@@ -71,6 +182,15 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def favorite_delete(self, request, pk):
         return self._action_delete(pk, FavoriteSerializer)
 
+    @action(methods=['POST'], detail=False,
+            url_path='favorite', url_name='favorite-bulk')
+    def favorite_bulk(self, request):
+        return self._bulk_action(FavoriteSerializer, True)
+
+    @favorite_bulk.mapping.delete
+    def favorite_bulk_delete(self, request):
+        return self._bulk_action(FavoriteSerializer, False)
+
     @action(methods=['POST'], detail=True)
     def shopping_cart(self, request, pk):
         return self._action_post(pk, ShoppingCartSerializer)
@@ -79,40 +199,27 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def shopping_cart_delete(self, request, pk):
         return self._action_delete(pk, ShoppingCartSerializer)
 
+    @action(methods=['POST'], detail=False,
+            url_path='shopping_cart', url_name='shopping-cart-bulk')
+    def shopping_cart_bulk(self, request):
+        return self._bulk_action(ShoppingCartSerializer, True)
+
+    @shopping_cart_bulk.mapping.delete
+    def shopping_cart_bulk_delete(self, request):
+        return self._bulk_action(ShoppingCartSerializer, False)
+
     @action(detail=False)
     def download_shopping_cart(self, request):
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = (
-            "attachment; filename='shopping_cart.pdf'"
-        )
-        p = canvas.Canvas(response)
-        arial = ttfonts.TTFont('Arial', 'data/arial.ttf')
-        pdfmetrics.registerFont(arial)
-        p.setFont('Arial', 14)
-
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=request.user).values_list(
-            'ingredient__name', 'amount', 'ingredient__measurement_unit')
-
-        ingr_list = {}
-        for name, amount, unit in ingredients:
-            if name not in ingr_list:
-                ingr_list[name] = {'amount': amount, 'unit': unit}
-            else:
-                ingr_list[name]['amount'] += amount
-        height = 700
-
-        p.drawString(100, 750, 'Список покупок')
-        is_page_done = False
-        for i, (name, data) in enumerate(ingr_list.items(), start=1):
-            p.drawString(
-                80, height,
-                f"{i}. {name} – {data['amount']} {data['unit']}")
-            height -= 25
-        if height <= 40:
-            p.showPage()
-            is_page_done = True
-        if not is_page_done:
-            p.showPage()
-        p.save()
+        version = get_cart_version(request.user.id)
+        etag = f'"{version}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = FileResponse(
+                get_shopping_list(request.user, version),
+                as_attachment=True,
+                filename='shopping_cart.pdf',
+                content_type='application/pdf'
+            )
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
         return response
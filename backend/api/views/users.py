@@ -1,59 +1,143 @@
+from django.conf import settings
+from django.db.models import BooleanField, Value
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 
-from api.serializers.users import FollowSerializer, UsersSerializer
+from api.serializers.fast import (FOLLOW_FIELDS, USER_FIELDS, build_follows,
+                                  build_user, build_users)
+from api.serializers.users import (FollowSerializer, UsersSerializer,
+                                   reset_followed_author_ids)
+from api.views.mixins import BulkActionMixin
+from recipes.services import (add_link, bulk_link, bulk_unlink, latest_recipes,
+                              prefetch_latest_recipes, remove_link)
 from users.models import Follow, User
 
 
-class UsersViewSet(UserViewSet):
+class UsersViewSet(BulkActionMixin, UserViewSet):
     queryset = User.objects.all()
     serializer_class = UsersSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    cursor_ordering = ('id',)
+    query_budgets = {
+        'list': 4,
+        'retrieve': 3,
+        'me': 2,
+        'subscriptions': 5,
+        'subscribe': 6,
+        'subscribe_delete': 5,
+        'subscribe_bulk': 6,
+        'subscribe_bulk_delete': 6,
+    }
 
     def get_permissions(self):
         if self.action == 'me':
             self.permission_classes = (IsAuthenticated,)
         return super().get_permissions()
 
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_READ_SERIALIZERS:
+            return super().list(request, *args, **kwargs)
+        rows = self.filter_queryset(self.get_queryset()).values(*USER_FIELDS)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(build_users(rows, request))
+        return self.get_paginated_response(build_users(page, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        # /me/ тоже вызывает retrieve, но отдает сериализатор djoser.
+        if self.action != 'retrieve' or not settings.FAST_READ_SERIALIZERS:
+            return super().retrieve(request, *args, **kwargs)
+        user = self.get_object()
+        return Response(build_user(
+            {field: getattr(user, field) for field in USER_FIELDS}, request))
+
+    def get_recipes_limit(self):
+        try:
+            recipes_limit = int(self.request.query_params.get(
+                'recipes_limit', settings.RECIPES_LIMIT_MAX))
+            if recipes_limit < 0:
+                raise ValueError
+        except ValueError:
+            raise ValidationError(
+                {'recipes_limit': 'Должно быть неотрицательным целым числом'}
+            )
+        return min(recipes_limit, settings.RECIPES_LIMIT_MAX)
+
     @action(methods=['POST'],
             detail=True, )
     def subscribe(self, request, id):
         user = request.user
         author = get_object_or_404(User, id=id)
-        subscription = Follow.objects.filter(
-            user=user, author=author)
-        if subscription.exists():
-            return Response({'error': 'Вы уже подписаны'},
-                            status=status.HTTP_400_BAD_REQUEST)
         if user == author:
             return Response({'error': 'Невозможно подписаться на себя'},
                             status=status.HTTP_400_BAD_REQUEST)
-        serializer = FollowSerializer(author, context={'request': request})
-        Follow.objects.create(user=user, author=author)
+        recipes_limit = self.get_recipes_limit()
+        if not add_link(Follow(user=user, author=author)):
+            return Response({'error': 'Вы уже подписаны'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        reset_followed_author_ids(request)
+        author.is_subscribed = True
+        serializer = FollowSerializer(
+            author,
+            context={'request': request, 'recipes_limit': recipes_limit}
+        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
     def subscribe_delete(self, request, id):
-        user = request.user
         author = get_object_or_404(User, id=id)
-        subscription = get_object_or_404(
-            Follow,
-            user=user,
-            author=author
-        )
-        subscription.delete()
+        if not remove_link(Follow, request.user, author.id):
+            raise NotFound
+        reset_followed_author_ids(request)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def _bulk_subscribe(self, link):
+        user = self.request.user
+        ids = self.get_bulk_ids()
+        if link:
+            errors = {user.id: (status.HTTP_400_BAD_REQUEST,
+                                'Невозможно подписаться на себя')}
+            states = bulk_link(
+                Follow, user, [pk for pk in ids if pk not in errors])
+            conflict = (status.HTTP_400_BAD_REQUEST, 'Вы уже подписаны')
+        else:
+            errors = None
+            states = bulk_unlink(Follow, user, ids)
+            conflict = (status.HTTP_404_NOT_FOUND, str(NotFound.default_detail))
+        reset_followed_author_ids(self.request)
+        return self.get_bulk_response(ids, states, link, conflict, errors)
+
+    @action(methods=['POST'], detail=False,
+            url_path='subscribe', url_name='subscribe-bulk')
+    def subscribe_bulk(self, request):
+        return self._bulk_subscribe(True)
+
+    @subscribe_bulk.mapping.delete
+    def subscribe_bulk_delete(self, request):
+        return self._bulk_subscribe(False)
+
     @action(detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         user = request.user
-        follows = User.objects.filter(following__user=user)
+        recipes_limit = self.get_recipes_limit()
+        follows = User.objects.filter(following__user=user).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        )
+        if settings.FAST_READ_SERIALIZERS:
+            page = self.paginate_queryset(follows.values(*FOLLOW_FIELDS))
+            return self.get_paginated_response(build_follows(
+                page,
+                latest_recipes([row['id'] for row in page], recipes_limit),
+                request
+            ))
         page = self.paginate_queryset(follows)
+        prefetch_latest_recipes(page, recipes_limit)
         serializer = FollowSerializer(
             page, many=True,
             context={'request': request})
@@ -1,4 +1,6 @@
 import os
+import sys
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -12,6 +14,8 @@ DEBUG = False
 
 ALLOWED_HOSTS = ['*']
 
+TESTING = sys.argv[1:2] == ['test']
+
 
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -32,6 +36,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,6 +78,80 @@ DATABASES = {
     }
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # Тестовая база в файле: тестам конкурентных запросов нужны
+    # несколько подключений к одной базе. Файл лежит вне репозитория,
+    # чтобы прерванный прогон не оставлял его в рабочей копии.
+    DATABASES['default']['TEST'] = {
+        'NAME': os.path.join(tempfile.gettempdir(), 'foodgram_test.sqlite3'),
+    }
+
+# Кеш общий для всех воркеров и management-команд: в нем лежат версии
+# данных, по которым сбрасываются закешированные ответы.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+        },
+    }
+}
+
+if TESTING:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'foodgram',
+        }
+    }
+
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+RESPONSE_CACHE_MAX_AGE = 60
+
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+SHOPPING_LIST_CACHE_MAX_SIZE = 1024 * 1024
+
+RECIPES_LIMIT_MAX = 50
+
+FAST_READ_SERIALIZERS = True
+
+BULK_ACTION_MAX_ITEMS = 500
+
+IMAGE_UPLOAD_MAX_SIZE = 5 * 1024 * 1024
+IMAGE_VARIANTS = {
+    'thumbnail': (320, 320),
+    'card': (640, 480),
+}
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
+
+TRENDING_WINDOW_DAYS = 7
+
+API_SERVER_TIMING = os.getenv('API_SERVER_TIMING', 'True') == 'True'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.metrics': {
+            'handlers': ['console'],
+            'level': ('ERROR' if TESTING
+                      else os.getenv('API_METRICS_LOG_LEVEL', 'INFO')),
+            'propagate': False,
+        },
+    },
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -98,6 +177,15 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'api.paginations.LimitPagination',
     'PAGE_SIZE': 6,
 }
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RecipesConfig(AppConfig):
     name = 'recipes'
     verbose_name = 'рецепты'
+
+    def ready(self):
+        import recipes.checks  # noqa: F401
+        import recipes.signals  # noqa: F401
@@ -0,0 +1,49 @@
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.utils import timezone
+
+VERSION_KEY = 'data_version:{}'
+CART_VERSION_KEY = 'shopping_cart_version:{}'
+RECIPE_VERSION_KEY = 'recipe_content_version:{}'
+
+
+def new_version():
+    return uuid4().hex, timezone.now()
+
+
+def get_version(name):
+    return cache.get_or_set(VERSION_KEY.format(name), new_version, None)
+
+
+def bump_version(*names):
+    cache.set_many(
+        {VERSION_KEY.format(name): new_version() for name in names}, None)
+
+
+def get_cart_version(user_id):
+    version = cache.get_or_set(
+        CART_VERSION_KEY.format(user_id), lambda: uuid4().hex, None)
+    ingredient_version, _ = get_version('ingredient')
+    return f'{version}-{ingredient_version}'
+
+
+def bump_cart_version(*user_ids):
+    cache.delete_many(
+        [CART_VERSION_KEY.format(user_id) for user_id in user_ids])
+
+
+def get_recipe_versions(recipe_ids):
+    keys = {pk: RECIPE_VERSION_KEY.format(pk) for pk in recipe_ids}
+    versions = cache.get_many(keys.values())
+    missing = {
+        key: uuid4().hex for key in keys.values() if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return {pk: versions[key] for pk, key in keys.items()}
+
+
+def bump_recipe_versions(*recipe_ids):
+    cache.delete_many(
+        [RECIPE_VERSION_KEY.format(recipe_id) for recipe_id in recipe_ids])
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, register
+from django.utils.module_loading import import_string
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    backend = import_string(settings.CACHES['default']['BACKEND'])
+    if settings.TESTING or not issubclass(backend, LocMemCache):
+        return []
+    return [Error(
+        'LocMemCache виден только одному процессу: версии данных, '
+        'сброшенные management-командами или другим воркером, '
+        'не дойдут до остальных, и они будут отдавать устаревшие ответы.',
+        hint='Укажите общий кеш в CACHE_BACKEND и CACHE_LOCATION '
+             '(FileBasedCache, Memcached, Redis).',
+        id='recipes.E001',
+    )]
@@ -0,0 +1,118 @@
+import base64
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+from recipes.storage import recipe_image_storage
+
+logger = logging.getLogger(__name__)
+
+IMAGES_DIR = 'recipes'
+VARIANTS_DIR = os.path.join(IMAGES_DIR, 'variants')
+# Размер куска кратен 4, чтобы каждый кусок декодировался отдельно.
+DECODE_CHUNK_SIZE = 64 * 1024 * 4
+
+
+def decoded_size(data):
+    return len(data) // 4 * 3 - data[-2:].count('=')
+
+
+def decode_base64(data):
+    file = SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    for start in range(0, len(data), DECODE_CHUNK_SIZE):
+        file.write(base64.b64decode(
+            data[start:start + DECODE_CHUNK_SIZE], validate=True))
+    file.seek(0)
+    return file
+
+
+def variant_name(name, variant):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return os.path.join(VARIANTS_DIR, f'{stem}_{variant}.webp')
+
+
+def variant_urls(image, request=None):
+    urls = {}
+    for variant in settings.IMAGE_VARIANTS:
+        if not image:
+            urls[variant] = None
+            continue
+        url = default_storage.url(variant_name(image.name, variant))
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        urls[variant] = url
+    return urls
+
+
+def generate_variants(name, force=False):
+    variants = {
+        variant_name(name, variant): size
+        for variant, size in settings.IMAGE_VARIANTS.items()
+        if force or not default_storage.exists(variant_name(name, variant))
+    }
+    if not variants:
+        return
+    with recipe_image_storage.open(name) as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        for path, size in variants.items():
+            content = BytesIO()
+            ImageOps.fit(image, size, Image.LANCZOS).save(
+                content, 'WEBP', quality=settings.IMAGE_VARIANT_QUALITY)
+            default_storage.delete(path)
+            default_storage.save(path, ContentFile(content.getvalue()))
+
+
+def generate_variants_safely(name, force=False):
+    try:
+        generate_variants(name, force)
+    except Exception:
+        logger.exception('Не удалось создать превью для %s', name)
+
+
+def orphan_images(min_age):
+    images = set(Recipe.objects.exclude(image='').values_list(
+        'image', flat=True))
+    variants = {
+        variant_name(name, variant)
+        for name in images for variant in settings.IMAGE_VARIANTS
+    }
+    modified_before = timezone.now() - min_age
+    for storage, directory, referenced in (
+        (recipe_image_storage, IMAGES_DIR, images),
+        (default_storage, VARIANTS_DIR, variants),
+    ):
+        if not storage.exists(directory):
+            continue
+        for filename in storage.listdir(directory)[1]:
+            name = os.path.join(directory, filename)
+            if (name not in referenced
+                    and storage.get_modified_time(name) < modified_before):
+                yield storage, name
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.IMAGE_VARIANT_WORKERS,
+        thread_name_prefix='image-variants'
+    )
+
+
+def schedule_variants(name):
+    if not settings.IMAGE_VARIANT_WORKERS:
+        transaction.on_commit(lambda: generate_variants_safely(name))
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(generate_variants_safely, name))
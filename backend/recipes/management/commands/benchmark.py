@@ -0,0 +1,400 @@
+import random
+import statistics
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+from urllib.parse import parse_qs, urlparse
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, override_settings
+from django.utils import timezone
+from reportlab.pdfbase import pdfmetrics, ttfonts
+from reportlab.pdfgen import canvas
+from rest_framework.authtoken.models import Token
+from rest_framework.pagination import Cursor
+from rest_framework.renderers import JSONRenderer
+
+from api.filters import search_by_name
+from api.instrumentation import QueryCounter
+from api.paginations import LimitCursorPagination
+from api.renderers import FastJSONRenderer
+from api.serializers.fast import (USER_FIELDS, build_recipe_contents,
+                                  build_users)
+from api.serializers.recipes import GetRecipeSerializer
+from api.serializers.users import UsersSerializer
+from api.shopping_list import FONT_NAME, FONT_PATH, render_shopping_list
+from api.views.recipes import RecipeViewSet
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart)
+from recipes.search import ingredient_index
+from recipes.services import bulk_create, count_subquery, shopping_totals
+from users.models import Follow, User
+
+BENCHMARKS = ('shopping_list', 'autocomplete', 'query_plans', 'pagination',
+              'serializers', 'renderer')
+BATCH_SIZE = 1000
+
+
+@contextmanager
+def rolled_back():
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def measure(function, repeat, calls=1):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000 / calls)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+def legacy_shopping_list(user):
+    # Реализация до выноса в api.shopping_list: шрифт регистрируется на
+    # каждый запрос, суммы считаются в Python, PDF собирается в памяти.
+    response = HttpResponse(content_type='application/pdf')
+    pdf = canvas.Canvas(response)
+    pdfmetrics.registerFont(ttfonts.TTFont(FONT_NAME, FONT_PATH))
+    pdf.setFont(FONT_NAME, 14)
+    totals = {}
+    for name, amount, unit in RecipeIngredient.objects.filter(
+            recipe__shopping_cart__user=user).values_list(
+            'ingredient__name', 'amount', 'ingredient__measurement_unit'):
+        if name not in totals:
+            totals[name] = {'amount': amount, 'unit': unit}
+        else:
+            totals[name]['amount'] += amount
+    height = 700
+    pdf.drawString(100, 750, 'Список покупок')
+    for i, (name, data) in enumerate(totals.items(), start=1):
+        pdf.drawString(
+            80, height, f"{i}. {name} – {data['amount']} {data['unit']}")
+        height -= 25
+    pdf.showPage()
+    pdf.save()
+    return response.content
+
+
+def legacy_ingredient_search(value):
+    # IngredientFilter.filter_name до появления индекса в recipes.search.
+    return list(Ingredient.objects.filter(
+        Q(name__istartswith=value) | Q(name__icontains=value)
+    ).annotate(
+        startswith=ExpressionWrapper(
+            Q(name__istartswith=value), output_field=BooleanField())
+    ).order_by('-startswith'))
+
+
+def search_values(names, count):
+    generator = random.Random(0)
+    values = []
+    for name in generator.choices(names, k=count):
+        start = generator.randrange(max(len(name) - 2, 1))
+        length = generator.randint(1, 5)
+        values.append(name[:length] if len(values) % 2 else
+                      name[start:start + length])
+    return values
+
+
+def plan_lookups(author, user, recipes):
+    # (запрос API, индекс, который он должен использовать, queryset).
+    lookups = [
+        ('лента', 'recipe_pub_date_idx',
+         Recipe.objects.order_by('-pub_date', '-id')[:6]),
+        ('рецепты автора', 'recipe_author_pub_date_idx',
+         Recipe.objects.filter(author=author).order_by('-pub_date', '-id')[:6]),
+        ('счетчик избранного', 'favorite_recipe_user_idx',
+         Recipe.objects.filter(pk__in=recipes).order_by().values_list(
+             count_subquery(Favorite, 'recipe'))),
+        ('счетчик корзин', 'cart_recipe_user_idx',
+         Recipe.objects.filter(pk__in=recipes).order_by().values_list(
+             count_subquery(ShoppingCart, 'recipe'))),
+        ('подписки', 'follow_user_author_idx',
+         User.objects.filter(following__user=user)[:6]),
+    ]
+    if connection.vendor == 'postgresql':
+        lookups.append(('поиск по названию', 'recipe_name_trgm_idx',
+                        search_by_name(Recipe.objects.all(), 'бенчмарк 7')))
+    return lookups
+
+
+@contextmanager
+def explicit_pub_date():
+    # auto_now перезаписывает дату и в bulk_create, а курсору нужны
+    # разные даты публикации, как в настоящей ленте.
+    field = Recipe._meta.get_field('pub_date')
+    field.auto_now = False
+    try:
+        yield
+    finally:
+        field.auto_now = True
+
+
+def create_plan_data(recipes, authors, links):
+    generator = random.Random(0)
+    bulk_create(User, (
+        User(username=f'benchmark_{number}',
+             email=f'benchmark_{number}@example.org')
+        for number in range(authors)
+    ), BATCH_SIZE)
+    users = list(User.objects.filter(
+        username__startswith='benchmark_').values_list('id', flat=True))
+    started = timezone.now() - timedelta(seconds=recipes)
+    with explicit_pub_date():
+        bulk_create(Recipe, (
+            Recipe(author_id=users[number % len(users)],
+                   name=f'Рецепт бенчмарк {number}', text='Текст',
+                   cooking_time=10, image='recipes/benchmark.jpg',
+                   pub_date=started + timedelta(seconds=number))
+            for number in range(recipes)
+        ), BATCH_SIZE)
+    recipe_ids = list(Recipe.objects.filter(
+        author__in=users).values_list('id', flat=True))
+    for model, field, targets in (
+        (Favorite, 'recipe', recipe_ids),
+        (ShoppingCart, 'recipe', recipe_ids),
+        (Follow, 'author', users),
+    ):
+        bulk_create(model, (
+            model(user_id=user, **{f'{field}_id': target})
+            for user in users
+            for target in generator.sample(targets, links)
+            if model is not Follow or target != user
+        ), BATCH_SIZE, ignore_conflicts=True)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return users, recipe_ids
+
+
+def cursor_at(depth):
+    recipe = Recipe.objects.order_by('-pub_date', '-id')[depth]
+    pagination = LimitCursorPagination()
+    pagination.base_url = '/api/recipes/'
+    url = pagination.encode_cursor(Cursor(
+        offset=0, reverse=False, position=str(recipe.pub_date)))
+    return parse_qs(urlparse(url).query)['cursor'][0]
+
+
+def anonymous_request():
+    request = RequestFactory().get('/api/recipes/')
+    request.user = AnonymousUser()
+    return request
+
+
+def model_recipe_contents(recipes, request):
+    serializer = GetRecipeSerializer(context={
+        'request': request,
+        'prefetch_related_plan': RecipeViewSet.prefetch_related_plan,
+    })
+    with override_settings(FAST_READ_SERIALIZERS=False):
+        return serializer.build_contents(recipes)
+
+
+def shopping_list(user):
+    file = render_shopping_list(shopping_totals(user).values_list(
+        'name', 'amount', 'measurement_unit').iterator())
+    with file:
+        while file.read(64 * 1024):
+            pass
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('benchmark', choices=BENCHMARKS)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--cart-size', type=int, default=500,
+            help='Сколько рецептов положить во временную корзину')
+        parser.add_argument(
+            '--queries', type=int, default=200,
+            help='Сколько поисковых запросов выполнить за один прогон')
+        parser.add_argument(
+            '--recipes', type=int, default=100000,
+            help='Сколько временных рецептов создать для планов запросов')
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument(
+            '--links', type=int, default=20,
+            help='Сколько избранных, покупок и подписок у каждого автора')
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=(10000, 100000),
+            help='Размеры ленты для сравнения пагинации')
+
+    def report(self, cases, repeat, calls=1):
+        self.stdout.write(
+            f'{"вариант":<40}{"медиана, мс":>14}{"пик памяти, КиБ":>18}')
+        for name, function in cases:
+            median, peak = measure(function, repeat, calls)
+            self.stdout.write(f'{name:<40}{median:>14.3f}{peak / 1024:>18.0f}')
+
+    def benchmark_shopping_list(self, options):
+        recipes = list(Recipe.objects.values_list(
+            'id', flat=True)[:options['cart_size']])
+        if not recipes:
+            raise CommandError('Сначала создайте данные: '
+                               'python manage.py seed_data')
+        user = User.objects.create(
+            username='benchmark', email='benchmark@example.org')
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=user, recipe_id=recipe) for recipe in recipes)
+        lines = shopping_totals(user).count()
+        self.stdout.write(
+            f'Рецептов в корзине: {len(recipes)}, строк в списке: {lines}')
+        self.report((
+            ('до: HttpResponse, суммы в Python',
+             lambda: legacy_shopping_list(user)),
+            ('после: суммы в БД, SpooledTemporaryFile',
+             lambda: shopping_list(user)),
+        ), options['repeat'])
+
+    def benchmark_autocomplete(self, options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            raise CommandError('Сначала загрузите ингредиенты: '
+                               'python manage.py load_data')
+        values = search_values(names, options['queries'])
+        ingredient_index.get_state()
+        self.stdout.write(f'Ингредиентов: {len(names)}, '
+                          f'запросов за прогон: {len(values)}')
+        self.report((
+            ('до: istartswith/icontains в БД',
+             lambda: [legacy_ingredient_search(value) for value in values]),
+            ('после: индекс в памяти',
+             lambda: [ingredient_index.search(value) for value in values]),
+        ), options['repeat'], len(values))
+        self.report((
+            ('построение индекса', ingredient_index.build),
+        ), options['repeat'])
+
+    def benchmark_query_plans(self, options):
+        if options['recipes'] < 1 or options['authors'] < 2:
+            raise CommandError('Нужен хотя бы один рецепт и два автора')
+        users, recipes = create_plan_data(
+            options['recipes'], options['authors'],
+            min(options['links'], options['authors'] - 1))
+        self.stdout.write(
+            f'Рецептов: {Recipe.objects.count()}, '
+            f'избранного: {Favorite.objects.count()}, '
+            f'покупок: {ShoppingCart.objects.count()}, '
+            f'подписок: {Follow.objects.count()}')
+        self.stdout.write(
+            f'{"запрос":<22}{"индекс":<30}{"выбран":>8}'
+            f'{"с индексом, мс":>16}{"без индекса, мс":>17}')
+        for name, index, queryset in plan_lookups(
+                users[0], users[1], recipes[:100]):
+            plan = queryset.explain()
+            with_index, _ = measure(
+                lambda: list(queryset.all()), options['repeat'])
+            with rolled_back():
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DROP INDEX {index}')
+                without_index, _ = measure(
+                    lambda: list(queryset.all()), options['repeat'])
+            self.stdout.write(
+                f'{name:<22}{index:<30}'
+                f'{"да" if index in plan else "нет":>8}'
+                f'{with_index:>16.3f}{without_index:>17.3f}')
+            if options['verbosity'] > 1:
+                self.stdout.write(plan)
+
+    def benchmark_pagination(self, options):
+        limit = 6
+        self.stdout.write(
+            f'{"рецептов":>10}  {"вариант":<28}{"медиана, мс":>14}'
+            f'{"запросы к БД":>14}')
+        for size in sorted(options['sizes']):
+            with rolled_back():
+                users, _ = create_plan_data(size, 100, 0)
+                token = Token.objects.create(user_id=users[0])
+                client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+                depth = Recipe.objects.count() * 9 // 10
+                for name, url in (
+                    ('страницы: первая', f'?limit={limit}'),
+                    ('страницы: 90% ленты',
+                     f'?limit={limit}&page={depth // limit + 1}'),
+                    ('курсор: первая', f'?cursor=&limit={limit}'),
+                    ('курсор: 90% ленты',
+                     f'?cursor={cursor_at(depth)}&limit={limit}'),
+                ):
+                    self.report_request(
+                        client, f'/api/recipes/{url}', size, name, options)
+
+    def benchmark_serializers(self, options):
+        # Содержимое рецептов строится только при промахе кеша, поэтому
+        # сравнивается именно build_contents, без кеша и полей пользователя.
+        recipes = Recipe.objects.select_related('author').order_by(
+            '-pub_date', '-id')[:BATCH_SIZE]
+        users = User.objects.order_by('id')[:BATCH_SIZE]
+        if not recipes.exists():
+            raise CommandError('Сначала создайте данные: '
+                               'python manage.py seed_data')
+        request = anonymous_request()
+        recipe_count, user_count = recipes.count(), users.count()
+        self.stdout.write(f'Рецептов: {recipe_count}, '
+                          f'пользователей: {user_count}; '
+                          f'время на 1000 объектов с запросами к БД')
+        self.report((
+            ('рецепты: ModelSerializer',
+             lambda: model_recipe_contents(list(recipes), request)),
+            ('рецепты: из строк values()',
+             lambda: build_recipe_contents(list(recipes), request)),
+        ), options['repeat'], recipe_count / BATCH_SIZE)
+        self.report((
+            ('пользователи: ModelSerializer',
+             lambda: UsersSerializer(
+                 users, many=True, context={'request': request}).data),
+            ('пользователи: из строк values()',
+             lambda: build_users(users.values(*USER_FIELDS), request)),
+        ), options['repeat'], user_count / BATCH_SIZE)
+
+    def benchmark_renderer(self, options):
+        recipes = list(Recipe.objects.select_related('author').order_by(
+            '-pub_date', '-id')[:BATCH_SIZE])
+        if not recipes:
+            raise CommandError('Сначала создайте данные: '
+                               'python manage.py seed_data')
+        contents = build_recipe_contents(recipes, anonymous_request())
+        data = OrderedDict((
+            ('count', len(recipes)),
+            ('next', None),
+            ('previous', None),
+            ('results', [contents[recipe.pk] for recipe in recipes]),
+        ))
+        expected = JSONRenderer().render(data)
+        self.stdout.write(
+            f'Рецептов в ответе: {len(recipes)}, '
+            f'размер: {len(expected) // 1024} КиБ, байты совпадают: '
+            f'{"да" if FastJSONRenderer().render(data) == expected else "нет"}')
+        self.report((
+            ('JSONRenderer', lambda: JSONRenderer().render(data)),
+            ('FastJSONRenderer', lambda: FastJSONRenderer().render(data)),
+        ), options['repeat'])
+
+    def report_request(self, client, url, size, name, options):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f'{url}: {response.status_code}')
+        median, _ = measure(lambda: client.get(url), options['repeat'])
+        self.stdout.write(
+            f'{size:>10}  {name:<28}{median:>14.3f}{counter.count:>14}')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('Количество повторов должно быть больше нуля')
+        with rolled_back():
+            getattr(self, f'benchmark_{options["benchmark"]}')(options)
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+
+from recipes.images import orphan_images
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=60,
+            help='Не удалять файлы моложе указанного числа минут')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать файлы, которые будут удалены')
+
+    def handle(self, *args, **options):
+        count = size = 0
+        for storage, name in orphan_images(
+                timedelta(minutes=options['min_age'])):
+            count += 1
+            size += storage.size(name)
+            self.stdout.write(name)
+            if not options['dry_run']:
+                storage.delete(name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'=== Неиспользуемых файлов: {count}, {size} байт ===')
+        )
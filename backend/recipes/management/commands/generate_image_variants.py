@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand
+
+from recipes.images import generate_variants_safely
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать уже существующие превью')
+
+    def handle(self, *args, **options):
+        images = Recipe.objects.exclude(image='').values_list(
+            'image', flat=True).iterator()
+        for name in images:
+            generate_variants_safely(name, options['force'])
+
+        self.stdout.write(self.style.SUCCESS(
+            '=== Превью картинок рецептов созданы ===')
+        )
@@ -1,25 +1,135 @@
 import csv
+import json
+import os
+import time
+from functools import reduce
+from io import StringIO
+from operator import or_
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
 
+from recipes.cache import bump_version
 from recipes.models import Ingredient, Tag
+from recipes.services import batches
 
+DATA_DIR = os.path.join(settings.BASE_DIR, 'data')
+# Модель: (файл по умолчанию, поля естественного ключа, остальные поля).
 MODELS_FILES = {
-    Ingredient: 'ingredients.csv',
-    Tag: 'tags.csv',
+    Ingredient: ('ingredients.csv', ('name', 'measurement_unit'), ()),
+    Tag: ('tags.csv', ('slug',), ('name', 'color')),
 }
 
 
+def read_rows(path, model):
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, 'r', encoding='utf-8') as file:
+        if extension == '.csv':
+            yield from csv.DictReader(file)
+        elif extension == '.jsonl':
+            yield from (json.loads(line) for line in file if line.strip())
+        elif extension == '.json':
+            for row in json.load(file):
+                if 'model' not in row:
+                    yield row
+                elif row['model'] == model._meta.label_lower:
+                    yield row['fields']
+        else:
+            raise CommandError(f'Неподдерживаемый формат файла: {path}')
+
+
+def upsert(model, rows, keys, fields):
+    objects = {
+        tuple(row[key] for key in keys): model(
+            **{field: row[field] for field in keys + fields})
+        for row in rows
+    }
+    if fields:
+        if len(keys) == 1:
+            lookup = Q(**{f'{keys[0]}__in': [key for key, in objects]})
+        else:
+            lookup = reduce(or_, (
+                Q(**dict(zip(keys, key))) for key in objects))
+        existing = model.objects.filter(lookup).values_list('pk', *keys)
+        for pk, *key in existing:
+            if tuple(key) in objects:
+                objects[tuple(key)].pk = pk
+        model.objects.bulk_update(
+            [obj for obj in objects.values() if obj.pk], fields)
+    model.objects.bulk_create(
+        [obj for obj in objects.values() if not obj.pk],
+        ignore_conflicts=True
+    )
+
+
+def copy_upsert(model, rows, keys, fields, batch_size):
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(map(connection.ops.quote_name, keys + fields))
+    key_columns = ', '.join(map(connection.ops.quote_name, keys))
+    if fields:
+        conflict = 'DO UPDATE SET ' + ', '.join(
+            f'{column} = EXCLUDED.{column}'
+            for column in map(connection.ops.quote_name, fields))
+    else:
+        conflict = 'DO NOTHING'
+    count = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE load_data ON COMMIT DROP AS '
+            f'SELECT {columns} FROM {table} WITH NO DATA')
+        for batch in batches(rows, batch_size):
+            buffer = StringIO()
+            csv.writer(buffer).writerows(
+                [row[field] for field in keys + fields] for row in batch)
+            buffer.seek(0)
+            count += len(batch)
+            cursor.copy_expert(
+                f'COPY load_data ({columns}) FROM STDIN WITH (FORMAT csv)',
+                buffer)
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) '
+            f'SELECT DISTINCT ON ({key_columns}) {columns} FROM load_data '
+            f'ON CONFLICT ({key_columns}) {conflict}')
+    return count
+
+
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        for model, (file, *_) in MODELS_FILES.items():
+            parser.add_argument(
+                f'--{model._meta.model_name}s',
+                default=os.path.join(DATA_DIR, file),
+                help='Файл CSV, JSON или JSON Lines с данными')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одной пачке')
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Загружать через COPY (только PostgreSQL)')
+
     def handle(self, *args, **options):
-        for model, file in MODELS_FILES.items():
-            with open(
-                    f'{settings.BASE_DIR}/data/{file}',
-                    'r', encoding='utf-8',
-            ) as table:
-                reader = csv.DictReader(table)
-                model.objects.bulk_create(model(**data) for data in reader)
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('COPY доступен только для PostgreSQL')
+        for model, (_, keys, fields) in MODELS_FILES.items():
+            started = time.monotonic()
+            rows = read_rows(options[f'{model._meta.model_name}s'], model)
+            if options['copy']:
+                count = copy_upsert(
+                    model, rows, keys, fields, options['batch_size'])
+            else:
+                count = 0
+                for batch in batches(rows, options['batch_size']):
+                    with transaction.atomic():
+                        upsert(model, batch, keys, fields)
+                    count += len(batch)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: {count} строк '
+                f'за {elapsed:.2f} с ({count / elapsed if elapsed else 0:.0f} строк/с)'
+            )
+        bump_version('ingredient', 'tag', 'catalog')
 
         self.stdout.write(self.style.SUCCESS(
             '=== Ингредиенты и теги успешно загружены ===')
@@ -0,0 +1,143 @@
+import math
+import random
+import time
+
+from django.core.cache import cache
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import resolve
+from rest_framework.authtoken.models import Token
+
+from api.instrumentation import QueryCounter, get_query_budget
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+# Сценарий: (путь, нужна ли авторизация).
+SCENARIOS = {
+    'recipes': ('/api/recipes/', False),
+    'recipes_limit': ('/api/recipes/?limit=60', False),
+    'recipes_cursor': ('/api/recipes/?cursor=&limit=20', False),
+    'recipes_tags': ('/api/recipes/?tags={tag}', False),
+    'recipes_author': ('/api/recipes/?author={author}', False),
+    'recipes_popular': ('/api/recipes/?ordering=popular', False),
+    'recipes_trending': ('/api/recipes/?ordering=trending', False),
+    'recipes_favorited': ('/api/recipes/?is_favorited=1', True),
+    'recipes_in_cart': ('/api/recipes/?is_in_shopping_cart=1', True),
+    'recipe_detail': ('/api/recipes/{recipe}/', False),
+    'subscriptions': ('/api/users/subscriptions/?recipes_limit=3', True),
+    'autocomplete': ('/api/ingredients/?name={prefix}', False),
+    'shopping_list': ('/api/recipes/download_shopping_cart/', True),
+}
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, percent):
+    return values[max(math.ceil(len(values) * percent / 100) - 1, 0)]
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', action='append', choices=SCENARIOS,
+            help='Запустить только указанные сценарии')
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--user', help='Email пользователя, от имени которого идут '
+                           'запросы (по умолчанию - с самой большой корзиной)')
+        parser.add_argument(
+            '--anonymous', action='store_true',
+            help='Запускать только публичные сценарии без авторизации')
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кеш перед каждым запросом')
+        parser.add_argument(
+            '--check-budgets', action='store_true',
+            help='Завершиться с ошибкой, если сценарий превысил лимит '
+                 'запросов к БД, объявленный во вьюсете')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def get_user(self, email):
+        if email:
+            return User.objects.get(email=email)
+        user = User.objects.annotate(
+            carts=Count('shopping_cart')).order_by('-carts').first()
+        if user is None:
+            raise CommandError('Сначала создайте данные: '
+                               'python manage.py seed_data')
+        return user
+
+    def get_choices(self):
+        return {
+            'tag': list(Tag.objects.values_list('slug', flat=True)),
+            'author': list(Recipe.objects.order_by().values_list(
+                'author_id', flat=True).distinct()[:1000]),
+            'recipe': list(Recipe.objects.values_list('id', flat=True)[:1000]),
+            'prefix': [name[:3] for name in Ingredient.objects.values_list(
+                'name', flat=True)[:1000]],
+        }
+
+    def run_scenario(self, client, path, choices, options):
+        timings, queries, errors = [], [], 0
+        for number in range(options['warmup'] + options['requests']):
+            url = path.format(**{
+                key: random.choice(values) for key, values in choices.items()
+            })
+            if options['cold']:
+                cache.clear()
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - started
+            if number < options['warmup']:
+                continue
+            timings.append(elapsed * 1000)
+            queries.append(counter.count)
+            errors += response.status_code >= 400
+        return sorted(timings), queries, errors
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('Количество запросов должно быть больше нуля')
+        random.seed(options['seed'])
+        client = Client()
+        if not options['anonymous']:
+            token, _ = Token.objects.get_or_create(
+                user=self.get_user(options['user']))
+            client.defaults['HTTP_AUTHORIZATION'] = f'Token {token.key}'
+        choices = self.get_choices()
+        if not all(choices.values()):
+            raise CommandError('Сначала создайте данные: '
+                               'python manage.py seed_data')
+        self.stdout.write(
+            f'{"сценарий":<20}{"ошибки":>8}'
+            + ''.join(f'{f"p{percent}, мс":>10}' for percent in PERCENTILES)
+            + f'{"запросы к БД":>14}{"лимит":>8}'
+        )
+        exceeded = []
+        for name in options['scenario'] or SCENARIOS:
+            path, auth_required = SCENARIOS[name]
+            if auth_required and options['anonymous']:
+                continue
+            timings, queries, errors = self.run_scenario(
+                client, path, choices, options)
+            budget = get_query_budget(resolve(path.split('?')[0].format(
+                **{key: values[0] for key, values in choices.items()}
+            )), 'GET')
+            if budget is not None and max(queries) > budget:
+                exceeded.append(f'{name}: {max(queries)} > {budget}')
+            self.stdout.write(
+                f'{name:<20}{errors:>8}'
+                + ''.join(f'{percentile(timings, percent):>10.1f}'
+                          for percent in PERCENTILES)
+                + f'{sum(queries) / len(queries):>14.1f}'
+                + f'{"-" if budget is None else budget:>8}'
+            )
+        if options['check_budgets'] and exceeded:
+            raise CommandError(
+                'Превышен лимит запросов к БД: ' + ', '.join(exceeded))
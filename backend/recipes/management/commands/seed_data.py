@@ -0,0 +1,153 @@
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from recipes.cache import bump_version
+from recipes.images import generate_variants_safely
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.services import bulk_create, recount_counters, refresh_rankings
+from recipes.storage import recipe_image_storage
+from users.models import Follow, User
+
+SEED_PASSWORD = 'seed-password'
+SEED_MEDIA_ROOT = os.path.join(tempfile.gettempdir(), 'foodgram_seed_media')
+
+
+def seed_image():
+    content = BytesIO()
+    Image.new('RGB', (640, 480), (226, 108, 45)).save(content, 'JPEG')
+    return recipe_image_storage.save(
+        'recipes/seed.jpg', ContentFile(content.getvalue()))
+
+
+def sample_pairs(users, targets, density, model, target_field):
+    count = min(int(len(targets) * density), len(targets))
+    for user in users:
+        sample = random.sample(targets, min(count + 1, len(targets)))
+        if model is Follow:
+            sample = [author for author in sample if author != user]
+        for target in sample[:count]:
+            yield model(user_id=user, **{f'{target_field}_id': target})
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes-per-author', type=int, default=5)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=6)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument(
+            '--follow-density', type=float, default=0.05,
+            help='Доля пользователей, на которых подписан каждый')
+        parser.add_argument(
+            '--favorite-density', type=float, default=0.02,
+            help='Доля рецептов в избранном у каждого пользователя')
+        parser.add_argument(
+            '--cart-density', type=float, default=0.01,
+            help='Доля рецептов в корзине у каждого пользователя')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument(
+            '--media-root', default=SEED_MEDIA_ROOT,
+            help='Куда сохранить картинку рецептов и ее превью; по умолчанию '
+                 'временный каталог, чтобы не засорять MEDIA_ROOT')
+
+    def handle(self, *args, **options):
+        with override_settings(MEDIA_ROOT=options['media_root']):
+            self.seed(options)
+
+    def seed(self, options):
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        tags = list(Tag.objects.values_list('id', flat=True))
+        if not ingredients or not tags:
+            raise CommandError('Сначала загрузите ингредиенты и теги: '
+                               'python manage.py load_data')
+        random.seed(options['seed'])
+        fake = Faker('ru_RU')
+        fake.seed_instance(options['seed'])
+        batch_size = options['batch_size']
+        started = time.monotonic()
+        run = uuid4().hex[:8]
+        password = make_password(SEED_PASSWORD)
+        image = seed_image()
+        now = timezone.now()
+
+        with transaction.atomic():
+            bulk_create(User, (
+                User(
+                    username=f'seed_{run}_{i}',
+                    email=f'seed_{run}_{i}@example.org',
+                    first_name=fake.first_name(),
+                    last_name=fake.last_name(),
+                    password=password,
+                ) for i in range(options['users'])
+            ), batch_size)
+            users = list(User.objects.filter(
+                username__startswith=f'seed_{run}_').values_list(
+                'id', flat=True))
+            bulk_create(Recipe, (
+                Recipe(
+                    author_id=author,
+                    name=fake.sentence(nb_words=3)[:200],
+                    text=fake.paragraph(nb_sentences=5),
+                    cooking_time=random.randint(5, 180),
+                    image=image,
+                )
+                for author in users
+                for _ in range(options['recipes_per_author'])
+            ), batch_size)
+            recipes = list(Recipe.objects.filter(
+                author__in=users).values_list('id', flat=True))
+            bulk_create(Recipe.tags.through, (
+                Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+                for recipe in recipes
+                for tag in random.sample(
+                    tags, min(options['tags_per_recipe'], len(tags)))
+            ), batch_size)
+            bulk_create(RecipeIngredient, (
+                RecipeIngredient(
+                    recipe_id=recipe, ingredient_id=ingredient,
+                    amount=random.randint(1, 500))
+                for recipe in recipes
+                for ingredient in random.sample(ingredients, min(
+                    options['ingredients_per_recipe'], len(ingredients)))
+            ), batch_size)
+            bulk_create(Follow, sample_pairs(
+                users, users, options['follow_density'], Follow, 'author'
+            ), batch_size, ignore_conflicts=True)
+            for model, density in (
+                (Favorite, options['favorite_density']),
+                (ShoppingCart, options['cart_density']),
+            ):
+                pairs = list(sample_pairs(
+                    users, recipes, density, model, 'recipe'))
+                for pair in pairs:
+                    pair.added_at = now - timedelta(
+                        seconds=random.randint(0, 30 * 24 * 60 * 60))
+                bulk_create(model, pairs, batch_size, ignore_conflicts=True)
+            recount_counters()
+        refresh_rankings(timedelta(days=settings.TRENDING_WINDOW_DAYS))
+        generate_variants_safely(image)
+        bump_version('recipe')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'=== Создано пользователей: {len(users)}, '
+            f'рецептов: {len(recipes)} за {elapsed:.2f} с ===')
+        )
+        self.stdout.write(f'Пароль пользователей: {SEED_PASSWORD}')
@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.services import recount_counters
+
+
+class Command(BaseCommand):
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recount_counters()
+
+        self.stdout.write(self.style.SUCCESS(
+            '=== Счётчики рецептов и пользователей пересчитаны ===')
+        )
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from recipes.services import refresh_rankings
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.TRENDING_WINDOW_DAYS,
+            help='Период в днях для рейтинга набирающих популярность')
+
+    def handle(self, *args, **options):
+        refresh_rankings(timedelta(days=options['days']))
+
+        self.stdout.write(self.style.SUCCESS(
+            '=== Рейтинги рецептов обновлены ===')
+        )
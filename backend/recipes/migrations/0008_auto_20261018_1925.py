@@ -0,0 +1,37 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_auto_20261018_1924'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeRanking',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='recipes.Recipe', verbose_name='Рецепт')),
+                ('popular_score', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Популярность')),
+                ('trending_score', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Популярность за период')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+            },
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='added_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='added_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:36
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_auto_20261018_1925'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/', verbose_name='Картинка'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:37
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        keep_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for duplicate in duplicates:
+        keep_id = duplicate.pop('keep_id')
+        del duplicate['total']
+        extra = Ingredient.objects.filter(**duplicate).exclude(id=keep_id)
+        for item in RecipeIngredient.objects.filter(ingredient__in=extra):
+            kept = RecipeIngredient.objects.filter(
+                recipe_id=item.recipe_id, ingredient_id=keep_id)
+            if kept.update(amount=F('amount') + item.amount):
+                item.delete()
+            else:
+                item.ingredient_id = keep_id
+                item.save(update_fields=('ingredient',))
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_auto_20261018_1936'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique ingredient'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_backfill_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='recipe',
+            name='recipe_author_pub_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_pub_date_idx'),
+        ),
+    ]
@@ -2,6 +2,9 @@ from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.db import models
 from django.db.models import UniqueConstraint
+from django.utils import timezone
+
+from recipes.storage import recipe_image_storage
 
 User = get_user_model()
 
@@ -19,6 +22,12 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique ingredient'
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
@@ -57,7 +66,8 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         verbose_name='Картинка',
-        upload_to='recipes/'
+        upload_to='recipes/',
+        storage=recipe_image_storage
     )
     name = models.CharField(
         verbose_name='Название',
@@ -88,11 +98,27 @@ class Recipe(models.Model):
         auto_now=True,
         verbose_name='Дата публикации'
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Раз в избранном',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Раз в корзине',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_idx'),
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='recipe_author_pub_date_idx'),
+        )
 
     def __str__(self):
         return f'{self.name[:50]}'
@@ -146,6 +172,11 @@ class Favorite(models.Model):
         verbose_name='Рецепты',
         related_name='favorite'
     )
+    added_at = models.DateTimeField(
+        verbose_name='Дата добавления',
+        default=timezone.now,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Избранный рецепт'
@@ -156,6 +187,10 @@ class Favorite(models.Model):
                 name='unique favorite'
             ),
         )
+        indexes = (
+            models.Index(fields=('recipe', 'user'),
+                         name='favorite_recipe_user_idx'),
+        )
 
     def __str__(self):
         return f'{self.recipe} в избранном у {self.user}'
@@ -174,6 +209,11 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепты',
         related_name='shopping_cart'
     )
+    added_at = models.DateTimeField(
+        verbose_name='Дата добавления',
+        default=timezone.now,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Рецепт в корзине'
@@ -184,6 +224,37 @@ class ShoppingCart(models.Model):
                 name='unique recipe in shopping cart'
             ),
         )
+        indexes = (
+            models.Index(fields=('recipe', 'user'),
+                         name='cart_recipe_user_idx'),
+        )
 
     def __str__(self):
         return f'{self.recipe} в корзине у {self.user}'
+
+
+class RecipeRanking(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Рецепт',
+        related_name='ranking'
+    )
+    popular_score = models.PositiveIntegerField(
+        verbose_name='Популярность',
+        default=0,
+        db_index=True
+    )
+    trending_score = models.PositiveIntegerField(
+        verbose_name='Популярность за период',
+        default=0,
+        db_index=True
+    )
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+
+    def __str__(self):
+        return f'{self.recipe}: {self.popular_score}, {self.trending_score}'
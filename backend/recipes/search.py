@@ -0,0 +1,61 @@
+from bisect import bisect_left
+
+from recipes.cache import get_version
+from recipes.models import Ingredient
+
+NGRAM_SIZE = 3
+
+
+def get_ngrams(value):
+    return {
+        value[i:i + NGRAM_SIZE]
+        for i in range(len(value) - NGRAM_SIZE + 1)
+    }
+
+
+class IngredientIndex:
+    def __init__(self):
+        self.version = None
+        self.state = None
+
+    def build(self):
+        ingredients = tuple(Ingredient.objects.order_by('id'))
+        by_name = sorted(
+            ingredients, key=lambda item: (item.name.lower(), item.id))
+        names = [ingredient.name.lower() for ingredient in by_name]
+        ngrams = {}
+        for position, name in enumerate(names):
+            for ngram in get_ngrams(name):
+                ngrams.setdefault(ngram, set()).add(position)
+        return ingredients, by_name, names, ngrams
+
+    def get_state(self):
+        version, _ = get_version('ingredient')
+        if self.state is None or self.version != version:
+            self.state = self.build()
+            self.version = version
+        return self.state
+
+    def search(self, value=''):
+        ingredients, by_name, names, ngrams = self.get_state()
+        value = value.lower()
+        if not value:
+            return list(ingredients)
+
+        start = end = bisect_left(names, value)
+        while end < len(names) and names[end].startswith(value):
+            end += 1
+
+        if len(value) < NGRAM_SIZE:
+            candidates = range(len(names))
+        else:
+            candidates = set.intersection(*(
+                ngrams.get(ngram, set()) for ngram in get_ngrams(value)))
+        contains = sorted(
+            position for position in candidates
+            if not start <= position < end and value in names[position]
+        )
+        return by_name[start:end] + [by_name[i] for i in contains]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,236 @@
+from itertools import islice
+
+from django.db import connections, router, transaction
+from django.db.models import (AutoField, Count, Exists, F, OuterRef, Subquery,
+                              Sum, Window)
+from django.db.models.functions import Coalesce, Greatest, RowNumber
+from django.db.models.sql import InsertQuery
+from django.utils import timezone
+
+from recipes.cache import bump_cart_version, bump_version
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeRanking,
+                            ShoppingCart)
+from users.models import Follow, User
+
+# Модель связи: (поле цели, счетчик на цели).
+LINKS = {
+    Favorite: ('recipe', 'favorites_count'),
+    ShoppingCart: ('recipe', 'in_carts_count'),
+    Follow: ('author', 'followers_count'),
+}
+
+
+def batches(rows, batch_size):
+    rows = iter(rows)
+    batch = list(islice(rows, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(rows, batch_size))
+
+
+def bulk_create(model, objects, batch_size, **kwargs):
+    for batch in batches(objects, batch_size):
+        model.objects.bulk_create(batch, **kwargs)
+
+
+def insert_ignore(instance):
+    # bulk_create(ignore_conflicts=True) не сообщает, вставилась ли строка,
+    # а get_or_create делает SELECT перед INSERT и гоняется с параллельным
+    # запросом. InsertQuery собирает тот же INSERT ... ON CONFLICT DO NOTHING
+    # (INSERT OR IGNORE в SQLite), что и bulk_create, а rowcount курсора
+    # показывает, была ли вставка. post_save не отправляется, поэтому
+    # счетчики и кеш обновляет вызывающий код через link_changed.
+    model = type(instance)
+    using = router.db_for_write(model)
+    query = InsertQuery(model, ignore_conflicts=True)
+    query.insert_values(
+        [field for field in model._meta.concrete_fields
+         if not isinstance(field, AutoField)],
+        [instance]
+    )
+    inserted = 0
+    with connections[using].cursor() as cursor:
+        for sql, params in query.get_compiler(using=using).as_sql():
+            cursor.execute(sql, params)
+            inserted += cursor.rowcount
+    return inserted > 0
+
+
+def delete_rows(queryset):
+    # QuerySet.delete() сначала выбирает строки для сигналов и каскадов,
+    # а потом удаляет их по pk: лишний запрос и окно, в котором параллельный
+    # запрос удалит те же строки. _raw_delete (его же Django использует для
+    # быстрого удаления) выполняет один DELETE и возвращает число строк.
+    # Подходит только для моделей без зависимых объектов; post_delete
+    # не отправляется, поэтому счетчики обновляет link_changed.
+    return queryset._raw_delete(queryset.db)
+
+
+def change_counter(model, pk, field, delta):
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)})
+
+
+def link_changed(model, user_id, pks, delta=None):
+    # Единственное место, где обновляются счетчики связей и версия корзины:
+    # сюда приходят и сигналы ORM (админка, каскадное удаление), и add_link,
+    # remove_link, bulk_link и bulk_unlink, которые сигналов не отправляют.
+    # Без delta счетчики пересчитываются по таблице связей.
+    if not pks:
+        return
+    field, counter = LINKS[model]
+    if delta is None:
+        recount_links(model, field, counter, pks)
+    else:
+        target = model._meta.get_field(field).related_model
+        for pk in pks:
+            change_counter(target, pk, counter, delta)
+    if model is ShoppingCart:
+        bump_cart_version(user_id)
+
+
+def add_link(instance):
+    model = type(instance)
+    field, _ = LINKS[model]
+    with transaction.atomic():
+        added = insert_ignore(instance)
+        if added:
+            link_changed(model, instance.user_id,
+                         [getattr(instance, f'{field}_id')], 1)
+    return added
+
+
+def remove_link(model, user, pk):
+    field, _ = LINKS[model]
+    with transaction.atomic():
+        removed = delete_rows(model.objects.filter(
+            user=user, **{f'{field}_id': pk})) > 0
+        if removed:
+            link_changed(model, user.id, [pk], -1)
+    return removed
+
+
+def shopping_totals(user):
+    return Ingredient.objects.filter(
+        recipeingredient__recipe__shopping_cart__user=user
+    ).annotate(
+        amount=Sum('recipeingredient__amount')
+    ).order_by('name', 'measurement_unit')
+
+
+def latest_recipes(author_ids, limit):
+    latest = {author_id: [] for author_id in author_ids}
+    if latest:
+        ranked = Recipe.objects.filter(author__in=latest).annotate(
+            recipe_rank=Window(
+                expression=RowNumber(),
+                partition_by=F('author'),
+                order_by=(F('pub_date').desc(), F('id').desc())
+            )
+        )
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) AS ranked WHERE recipe_rank <= %s '
+            f'ORDER BY recipe_rank',
+            (*params, limit)
+        )
+        for recipe in recipes:
+            latest[recipe.author_id].append(recipe)
+    return latest
+
+
+def prefetch_latest_recipes(authors, limit):
+    latest = latest_recipes([author.id for author in authors], limit)
+    for author in authors:
+        author.latest_recipes = latest[author.id]
+
+
+def count_subquery(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def recount_counters():
+    Recipe.objects.update(
+        favorites_count=count_subquery(Favorite, 'recipe'),
+        in_carts_count=count_subquery(ShoppingCart, 'recipe'),
+    )
+    User.objects.update(
+        recipes_count=count_subquery(Recipe, 'author'),
+        followers_count=count_subquery(Follow, 'author'),
+    )
+
+
+def link_states(model, user, field, pks):
+    return dict(model._meta.get_field(field).related_model.objects.filter(
+        pk__in=pks
+    ).annotate(linked=Exists(model.objects.filter(
+        user=user, **{field: OuterRef('pk')}
+    ))).values_list('pk', 'linked'))
+
+
+def recount_links(model, field, counter, pks):
+    model._meta.get_field(field).related_model.objects.filter(
+        pk__in=pks).update(**{counter: count_subquery(model, field)})
+
+
+def bulk_link(model, user, pks):
+    field, _ = LINKS[model]
+    with transaction.atomic():
+        states = link_states(model, user, field, pks)
+        added = [pk for pk, linked in states.items() if not linked]
+        model.objects.bulk_create(
+            [model(user=user, **{f'{field}_id': pk}) for pk in added],
+            ignore_conflicts=True
+        )
+        link_changed(model, user.id, added)
+    return states
+
+
+def bulk_unlink(model, user, pks):
+    field, _ = LINKS[model]
+    with transaction.atomic():
+        states = link_states(model, user, field, pks)
+        removed = [pk for pk, linked in states.items() if linked]
+        delete_rows(model.objects.filter(
+            user=user, **{f'{field}__in': removed}))
+        link_changed(model, user.id, removed)
+    return states
+
+
+def refresh_rankings(window, batch_size=1000):
+    since = timezone.now() - window
+    trending = {}
+    for model in (Favorite, ShoppingCart):
+        added = model.objects.filter(added_at__gte=since).order_by().values(
+            'recipe').annotate(total=Count('pk')).values_list(
+            'recipe', 'total')
+        for recipe_id, total in added:
+            trending[recipe_id] = trending.get(recipe_id, 0) + total
+
+    with transaction.atomic():
+        bulk_create(
+            RecipeRanking,
+            (RecipeRanking(recipe_id=recipe_id)
+             for recipe_id in Recipe.objects.filter(
+                 ranking__isnull=True).values_list('id', flat=True)),
+            batch_size
+        )
+        RecipeRanking.objects.exclude(
+            popular_score=F('recipe__favorites_count')
+            + F('recipe__in_carts_count')
+        ).update(popular_score=Subquery(
+            Recipe.objects.filter(pk=OuterRef('recipe')).values(
+                score=F('favorites_count') + F('in_carts_count'))
+        ))
+        RecipeRanking.objects.filter(
+            trending_score__gt=0).update(trending_score=0)
+        RecipeRanking.objects.bulk_update(
+            [RecipeRanking(recipe_id=recipe_id, trending_score=score)
+             for recipe_id, score in trending.items()],
+            ('trending_score',),
+            batch_size=batch_size
+        )
+    bump_version('ranking')
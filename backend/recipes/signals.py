@@ -0,0 +1,144 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from recipes.cache import bump_cart_version, bump_recipe_versions, bump_version
+from recipes.images import schedule_variants
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.services import LINKS, change_counter, link_changed
+from users.models import Follow
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    bump_version('ingredient')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    bump_version('tag')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipes(**kwargs):
+    bump_version('recipe')
+
+
+def bump_recipe_carts(recipe_id):
+    bump_cart_version(*ShoppingCart.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_recipe_carts(instance, created, **kwargs):
+    if not created:
+        bump_recipe_carts(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_ingredient_carts(instance, **kwargs):
+    bump_recipe_carts(instance.recipe_id)
+
+
+@receiver(post_save, sender=Recipe)
+def generate_image_variants(instance, update_fields=None, **kwargs):
+    if instance.image and (update_fields is None or 'image' in update_fields):
+        schedule_variants(instance.image.name)
+
+
+def tagged_recipe_ids(tag_id):
+    return list(Recipe.tags.through.objects.filter(
+        tag_id=tag_id).values_list('recipe_id', flat=True))
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_recipe_ingredients(instance, **kwargs):
+    bump_recipe_versions(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        bump_recipe_versions(instance.pk)
+    elif action == 'pre_clear':
+        bump_recipe_versions(*tagged_recipe_ids(instance.pk))
+    else:
+        bump_recipe_versions(*pk_set)
+
+
+@receiver(post_save, sender=Ingredient)
+def invalidate_ingredient_recipes(instance, created, **kwargs):
+    if not created:
+        bump_recipe_versions(*RecipeIngredient.objects.filter(
+            ingredient=instance).values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+def invalidate_tag_recipes(instance, created, **kwargs):
+    if not created:
+        bump_recipe_versions(*tagged_recipe_ids(instance.pk))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tag_recipes(instance, **kwargs):
+    # Связи с рецептами удаляются каскадом без сигналов m2m_changed.
+    instance.recipe_ids = tagged_recipe_ids(instance.pk)
+
+
+@receiver(post_delete, sender=Tag)
+def invalidate_deleted_tag_recipes(instance, **kwargs):
+    bump_recipe_versions(*getattr(instance, 'recipe_ids', ()))
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_recipes(instance, created, update_fields=None,
+                              **kwargs):
+    if created or update_fields is not None and not (
+            set(update_fields) - {'last_login'}):
+        return
+    recipe_ids = list(Recipe.objects.filter(
+        author=instance).values_list('id', flat=True))
+    if recipe_ids:
+        bump_recipe_versions(*recipe_ids)
+        bump_version('recipe')
+
+
+@receiver(post_save, sender=Recipe)
+def count_created_recipe(instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+def link_target(sender, instance):
+    field, _ = LINKS[sender]
+    return getattr(instance, f'{field}_id')
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+def count_created_link(sender, instance, created, **kwargs):
+    if created:
+        link_changed(sender, instance.user_id,
+                     [link_target(sender, instance)], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Follow)
+def count_deleted_link(sender, instance, **kwargs):
+    link_changed(sender, instance.user_id,
+                 [link_target(sender, instance)], -1)
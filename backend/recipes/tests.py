@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from api.filters import search_by_name
+from recipes.checks import check_shared_cache
+from recipes.images import orphan_images
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.storage import recipe_image_storage
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def test_same_content_is_stored_once(self):
+        first = recipe_image_storage.save(
+            'recipes/photo.png', ContentFile(b'image'))
+        second = recipe_image_storage.save(
+            'recipes/other.PNG', ContentFile(b'image'))
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith('.png'))
+        self.assertTrue(recipe_image_storage.exists(first))
+
+    def test_reupload_protects_orphan_from_collection(self):
+        name = recipe_image_storage.save(
+            'recipes/photo.png', ContentFile(b'orphan'))
+        old = time.time() - 2 * 60 * 60
+        os.utime(recipe_image_storage.path(name), (old, old))
+        min_age = timedelta(hours=1)
+        self.assertIn(name, [name for _, name in orphan_images(min_age)])
+        recipe_image_storage.save('recipes/photo.png', ContentFile(b'orphan'))
+        self.assertNotIn(name, [name for _, name in orphan_images(min_age)])
+
+
+@override_settings(MEDIA_ROOT=os.path.join(MEDIA_ROOT, 'media'))
+class SeedDataTest(TestCase):
+    def test_images_are_written_to_given_media_root(self):
+        Ingredient.objects.create(name='Соль', measurement_unit='г')
+        Tag.objects.create(name='Обед', color='#000000', slug='lunch')
+        media_root = os.path.join(MEDIA_ROOT, 'seed')
+        call_command('seed_data', '--users', '2', '--media-root', media_root,
+                     stdout=StringIO())
+        image = Recipe.objects.values_list('image', flat=True).first()
+        self.assertTrue(os.path.isfile(os.path.join(media_root, image)))
+        self.assertFalse(os.path.exists(
+            os.path.join(settings.MEDIA_ROOT, image)))
+        shutil.rmtree(media_root)
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'Триграммные индексы создаются только в PostgreSQL')
+class TrigramIndexTest(TestCase):
+    def explain(self, queryset):
+        # На пустой таблице планировщику дешевле полный просмотр, поэтому
+        # он отключается: проверяется, что запрос вообще может взять индекс.
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_name_search_uses_trigram_indexes(self):
+        cases = (
+            (search_by_name(Recipe.objects.all(), 'суп'),
+             'recipe_name_trgm_idx'),
+            (Recipe.objects.filter(name__icontains='суп'),
+             'recipe_name_trgm_idx'),
+            (Ingredient.objects.filter(name__icontains='сах'),
+             'ingredient_name_trgm_idx'),
+        )
+        for queryset, index in cases:
+            with self.subTest(index=index, query=str(queryset.query)):
+                self.assertIn(index, self.explain(queryset))
+
+
+class SharedCacheCheckTest(SimpleTestCase):
+    def test_local_memory_cache_is_rejected_outside_tests(self):
+        self.assertEqual(check_shared_cache(None), [])
+        with self.settings(TESTING=False):
+            self.assertEqual(
+                [error.id for error in check_shared_cache(None)],
+                ['recipes.E001'])
+        with self.settings(TESTING=False, CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(MEDIA_ROOT, 'cache'),
+        }}):
+            self.assertEqual(check_shared_cache(None), [])